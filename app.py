@@ -1,13 +1,50 @@
 import sys
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from loguru import logger
 from starlette.middleware.cors import CORSMiddleware
 
 from configs.Environment import get_environment_variables
+from configs.Executors import pdf_executor
+from configs.Qdrant import bootstrap_collection
 from errors.handlers import init_exception_handlers
+from ml.lifespan import local_models
+from repositories.workers import close_workers
+from routing.v1.health import router as health_router
+from routing.v1.indexing import router as indexing_router
+from routing.v1.search import router as search_router
+from routing.v1.workers import embedding_router, llm_router
+from services.health import API_ROLES
+from services.jobs import indexing_queue
 
-app = FastAPI(openapi_url="/core/openapi.json", docs_url="/core/docs")
+env = get_environment_variables()
+
+indexing = env.APP_ROLE in ("all", "indexing")
+search = env.APP_ROLE in ("all", "search")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if env.APP_ROLE in API_ROLES:
+        await bootstrap_collection()
+    # models load in the background, /api/v1/health/ready reports when they are up
+    if env.MODELS_WARMUP:
+        for model in local_models(env.APP_ROLE):
+            model.warm()
+    if indexing:
+        await indexing_queue.start()
+    yield
+    if indexing:
+        await indexing_queue.stop()
+    await close_workers()
+    if pdf_executor:
+        pdf_executor.shutdown(cancel_futures=True)
+
+
+app = FastAPI(
+    openapi_url="/core/openapi.json", docs_url="/core/docs", lifespan=lifespan
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,7 +56,15 @@ app.add_middleware(
 
 init_exception_handlers(app)
 
-env = get_environment_variables()
+app.include_router(health_router)
+if indexing:
+    app.include_router(indexing_router)
+if search:
+    app.include_router(search_router)
+if env.APP_ROLE == "embedding":
+    app.include_router(embedding_router)
+if env.APP_ROLE == "llm":
+    app.include_router(llm_router)
 
 if not env.DEBUG:
     logger.remove()
@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Literal
 
 from pydantic_settings import BaseSettings
 
@@ -13,6 +14,78 @@ class EnvironmentSettings(BaseSettings):
     QDRANT_HOST: str
     QDRANT_PORT: int
     QDRANT_COLLECTION: str
+    QDRANT_UPSERT_BATCH_SIZE: int = 256
+    # estimated request body per upsert, below Qdrant's default 32 MB limit
+    QDRANT_UPSERT_MAX_MB: int = 16
+    QDRANT_UPSERT_WAIT: bool = True
+    QDRANT_UPSERT_WORKERS: int = 2
+    QDRANT_POOLED_BINARY: bool = False
+
+    MINIO_HOST: str
+    MINIO_ACCESS: str
+    MINIO_SECRET: str
+    MINIO_BASE_BUCKET: str
+
+    EMBEDDING_DEVICE: str = ""
+    EMBEDDING_CPU_BF16: bool = False
+    EMBEDDING_QUANTIZATION: Literal["none", "int8"] = "none"
+    EMBEDDING_THREADS: int = 0
+    EMBEDDING_MAX_BATCH_SIZE: int = 16
+    EMBEDDING_MAX_WAIT_MS: int = 10
+    EMBEDDING_WORKERS: int = 1
+    EMBEDDING_CACHE_SIZE: int = 256
+    EMBEDDING_CACHE_DIR: str = ""
+    QUERY_CACHE_SIZE: int = 4096
+    IMAGE_PERCEPTUAL_HASH: bool = False
+    IMAGE_MIN_PIXELS: int = 0
+    # 1280 visual tokens of 28x28 px; 0 keeps images at full size
+    IMAGE_MAX_PIXELS: int = 1003520
+    IMAGE_PREPROCESS_WORKERS: int = 4
+    PARSING_WORKERS: int = 2
+    PDF_EXTRACT_WORKERS: int = 0
+    PDF_EXTRACT_PAGES_PER_TASK: int = 8
+    # off, auto or all: PDF pages rendered and embedded as images
+    PDF_PAGE_RENDER: Literal["off", "auto", "all"] = "off"
+    PDF_RENDER_DPI: int = 96
+    PDF_RENDER_MAX_TEXT_DENSITY: float = 2.0
+    PDF_RENDER_MIN_DRAWINGS: int = 20
+    PDF_RENDER_CACHE_DIR: str = ""
+    INDEXING_WORKERS: int = 2
+    INDEXING_QUEUE_SIZE: int = 4
+    INDEXING_JOB_LEASE: float = 60
+    # forward passes per parsed batch; texts are sorted by length across them
+    INDEXING_BUCKET_BATCHES: int = 4
+
+    # words: windows of 100 words; tokens: sentences packed by embedder tokens
+    CHUNKING_MODE: Literal["words", "tokens"] = "words"
+    CHUNK_MAX_TOKENS: int = 256
+    CHUNK_OVERLAP_TOKENS: int = 32
+
+    CONFLUENCE_CONCURRENCY: int = 8
+    CONFLUENCE_PAGE_LIMIT: int = 100
+    CONFLUENCE_MAX_RETRIES: int = 8
+
+    LLM_POOL_SIZE: int = 1
+    LLM_MAX_WAITING: int = 8
+    LLM_ACQUIRE_TIMEOUT: float = 30
+
+    ANSWER_CACHE_BACKEND: str = ""
+    ANSWER_CACHE_DIR: str = "answer_cache"
+    ANSWER_CACHE_SIZE: int = 1024
+    ANSWER_CACHE_TTL: int = 86400
+    # normalized MaxSim between the question tokens of two text queries
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+
+    # all, indexing or search: which routers, workers and models this process runs;
+    # embedding and llm run a model worker that API processes call over HTTP
+    APP_ROLE: Literal["all", "indexing", "search", "embedding", "llm"] = "all"
+    MODELS_WARMUP: bool = True
+
+    # when set, the model is served by that worker instead of being loaded in process
+    EMBEDDING_WORKER_URL: str = ""
+    LLM_WORKER_URL: str = ""
+    WORKER_TIMEOUT: float = 300
+    WORKER_MAX_CONNECTIONS: int = 32
 
     DEBUG: bool
 
@@ -0,0 +1,37 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+from configs.Environment import get_environment_variables
+
+env = get_environment_variables()
+
+# CPU-bound work gets its own sized pools so that it never competes with the
+# event loop's default executor, which is left to blocking I/O.
+
+embedding_executor = ThreadPoolExecutor(
+    max_workers=env.EMBEDDING_WORKERS, thread_name_prefix="embedding"
+)
+
+# every running generation and every request waiting for a model holds a thread
+llm_executor = ThreadPoolExecutor(
+    max_workers=env.LLM_POOL_SIZE + env.LLM_MAX_WAITING, thread_name_prefix="llm"
+)
+
+# PIL releases the GIL while decoding and resizing, so images of a batch are prepared in parallel
+image_executor = ThreadPoolExecutor(
+    max_workers=env.IMAGE_PREPROCESS_WORKERS, thread_name_prefix="image"
+)
+
+parsing_executor = ThreadPoolExecutor(
+    max_workers=env.PARSING_WORKERS, thread_name_prefix="parsing"
+)
+
+# PyMuPDF holds the GIL while it parses, so large PDFs are split across processes;
+# spawn keeps the workers free of the models and threads of the parent
+pdf_executor = (
+    ProcessPoolExecutor(
+        max_workers=env.PDF_EXTRACT_WORKERS, mp_context=get_context("spawn")
+    )
+    if env.PDF_EXTRACT_WORKERS > 1
+    else None
+)
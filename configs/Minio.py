@@ -1,4 +1,4 @@
-from minio import Minio
+from miniopy_async import Minio
 
 from configs.Environment import get_environment_variables
 
@@ -1,19 +1,68 @@
-from qdrant_client.models import VectorParams, Distance
-from qdrant_client.qdrant_client import QdrantClient
+from qdrant_client.models import (
+    VectorParams,
+    Distance,
+    MultiVectorConfig,
+    MultiVectorComparator,
+    HnswConfigDiff,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    PayloadSchemaType,
+)
+from loguru import logger
+from qdrant_client import AsyncQdrantClient
 
 from configs.Environment import get_environment_variables
+from ml.constants import EMBEDDING_DIM
 
 env = get_environment_variables()
 
+MULTIVECTOR_NAME = "colqwen"
+POOLED_VECTOR_NAME = "pooled"
 
-client = QdrantClient(host=env.QDRANT_HOST, port=env.QDRANT_PORT)
+async_client = AsyncQdrantClient(host=env.QDRANT_HOST, port=env.QDRANT_PORT)
 
-if not client.collection_exists(env.QDRANT_COLLECTION):
-    client.create_collection(
+collection_ready = False
+
+
+async def bootstrap_collection():
+    # called from the app lifespan, so importing this module never touches Qdrant
+    global collection_ready
+    if not await async_client.collection_exists(env.QDRANT_COLLECTION):
+        await create_collection()
+    collection_ready = True
+
+
+async def create_collection():
+    logger.info(f"Qdrant - creating collection {env.QDRANT_COLLECTION}")
+    await async_client.create_collection(
+        collection_name=env.QDRANT_COLLECTION,
+        vectors_config={
+            # only used to rescore prefetched candidates, so no HNSW graph
+            MULTIVECTOR_NAME: VectorParams(
+                size=EMBEDDING_DIM,
+                distance=Distance.COSINE,
+                multivector_config=MultiVectorConfig(
+                    comparator=MultiVectorComparator.MAX_SIM
+                ),
+                hnsw_config=HnswConfigDiff(m=0),
+            ),
+            POOLED_VECTOR_NAME: VectorParams(
+                size=EMBEDDING_DIM,
+                distance=Distance.COSINE,
+                quantization_config=BinaryQuantization(
+                    binary=BinaryQuantizationConfig(always_ram=True)
+                )
+                if env.QDRANT_POOLED_BINARY
+                else None,
+            ),
+        },
+    )
+    await async_client.create_payload_index(
         collection_name=env.QDRANT_COLLECTION,
-        vectors_config=VectorParams(size=3840, distance=Distance.COSINE),
+        field_name="id",
+        field_schema=PayloadSchemaType.KEYWORD,
     )
 
 
-def get_client() -> QdrantClient:
-    yield client
+def get_client() -> AsyncQdrantClient:
+    yield async_client
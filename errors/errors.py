@@ -16,3 +16,8 @@ class ErrBadRequest(Exception):
 class ErrNotAuthorized(Exception):
     def __int__(self, message):
         super().__init__(message)
+
+
+class ErrServiceUnavailable(Exception):
+    def __int__(self, message):
+        super().__init__(message)
@@ -10,6 +10,7 @@ from errors.errors import (
     ErrEntityConflict,
     ErrBadRequest,
     ErrNotAuthorized,
+    ErrServiceUnavailable,
 )
 
 
@@ -48,6 +49,17 @@ async def bad_request_exception_handler(request: Request, e: ErrBadRequest):
     )
 
 
+async def service_unavailable_exception_handler(
+    request: Request, e: ErrServiceUnavailable
+):
+    logger.warning(f"err = {e}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(e)},
+        headers={"Retry-After": "1"},
+    )
+
+
 async def internal_server_exception_handler(request: Request, e: ErrBadRequest):
     logger.error(f"err = {e}")
     return JSONResponse(
@@ -64,4 +76,8 @@ def init_exception_handlers(app: FastAPI):
 
     app.add_exception_handler(ErrBadRequest, bad_request_exception_handler)
 
+    app.add_exception_handler(
+        ErrServiceUnavailable, service_unavailable_exception_handler
+    )
+
     app.add_exception_handler(500, internal_server_exception_handler)
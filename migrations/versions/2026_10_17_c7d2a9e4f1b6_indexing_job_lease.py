@@ -0,0 +1,33 @@
+"""indexing job lease
+
+Revision ID: c7d2a9e4f1b6
+Revises: a1c4e2f0b9d3
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c7d2a9e4f1b6"
+down_revision: Union[str, None] = "a1c4e2f0b9d3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "indexing_jobs", sa.Column("owner", sa.String(length=32), nullable=True)
+    )
+    op.add_column(
+        "indexing_jobs",
+        sa.Column("lease_until", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("indexing_jobs", "lease_until")
+    op.drop_column("indexing_jobs", "owner")
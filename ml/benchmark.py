@@ -0,0 +1,140 @@
+"""
+Сравнение режимов инференса ColQwen2 на фиксированном локальном корпусе.
+
+Корпус - каталог с изображениями страниц и файлом queries.json вида
+[{"query": "текст запроса", "page": "имя файла страницы"}, ...].
+
+Для каждого режима считаются скорость эмбеддинга страниц, задержка одиночного
+запроса, recall@k по ожидаемым страницам и совпадение top-k с первым (базовым) режимом:
+
+    python -m ml.benchmark corpus/ --modes bf16,fp32,int8 --threads 8
+"""
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, List
+
+import torch
+
+from ml.embedding import EmbeddingEngine
+from ml.lifespan import load_colqwen
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+# dtype and quantization of every mode, all of them run on the CPU
+MODES = {
+    "bf16": (torch.bfloat16, "none"),
+    "fp32": (torch.float32, "none"),
+    "int8": (torch.float32, "int8"),
+}
+
+
+def max_sim(query: torch.Tensor, pages: List[torch.Tensor]) -> torch.Tensor:
+    """
+    Оценки MaxSim запроса по всем страницам.
+    :param query: Тензор (количество токенов, размерность).
+    :param pages: Тензоры страниц (количество патчей, размерность).
+    :return: Тензор оценок длины len(pages).
+    """
+    return torch.stack([(query @ page.T).max(dim=1).values.sum() for page in pages])
+
+
+def run_mode(
+    mode: str, pages: List[bytes], queries: List[str], batch_size: int
+) -> Dict[str, Any]:
+    """
+    Эмбеддинги корпуса и запросов в одном режиме.
+    :param mode: Имя режима из MODES.
+    :param pages: Изображения страниц.
+    :param queries: Тексты запросов.
+    :param batch_size: Размер батча для страниц.
+    :return: Эмбеддинги и замеры времени.
+    """
+    dtype, quantization = MODES[mode]
+    model, processor = load_colqwen("cpu", dtype, quantization)
+    engine = EmbeddingEngine(model, processor, "cpu", max_batch_size=batch_size)
+
+    started = time.perf_counter()
+    page_embeddings = engine.embed_images(pages)
+    pages_seconds = time.perf_counter() - started
+
+    query_embeddings, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        query_embeddings.extend(engine.embed_texts([query]))
+        latencies.append(time.perf_counter() - started)
+
+    del engine, model, processor
+    gc.collect()
+    return {
+        "pages": page_embeddings,
+        "queries": query_embeddings,
+        "pages_per_second": len(pages) / pages_seconds,
+        "query_ms_p50": statistics.median(latencies) * 1000,
+        "query_ms_max": max(latencies) * 1000,
+    }
+
+
+def rankings(result: Dict[str, Any]) -> List[List[int]]:
+    return [
+        max_sim(query, result["pages"]).argsort(descending=True).tolist()
+        for query in result["queries"]
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("corpus", help="каталог со страницами и queries.json")
+    parser.add_argument("--modes", default="bf16,fp32,int8")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    names = sorted(
+        name
+        for name in os.listdir(args.corpus)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    pages = []
+    for name in names:
+        with open(os.path.join(args.corpus, name), "rb") as file:
+            pages.append(file.read())
+    with open(os.path.join(args.corpus, "queries.json"), encoding="utf-8") as file:
+        labeled = json.load(file)
+    queries = [item["query"] for item in labeled]
+    expected = [names.index(item["page"]) for item in labeled]
+
+    report, baseline = {}, None
+    for mode in args.modes.split(","):
+        result = run_mode(mode, pages, queries, args.batch_size)
+        ranked = rankings(result)
+        top = [ranking[: args.top_k] for ranking in ranked]
+        report[mode] = {
+            "pages_per_second": round(result["pages_per_second"], 2),
+            "query_ms_p50": round(result["query_ms_p50"], 1),
+            "query_ms_max": round(result["query_ms_max"], 1),
+            "recall@1": sum(r[0] == e for r, e in zip(ranked, expected)) / len(ranked),
+            f"recall@{args.top_k}": sum(e in t for t, e in zip(top, expected))
+            / len(top),
+        }
+        if baseline is None:
+            baseline = top
+        else:
+            # share of the baseline's top-k that this mode also returns
+            report[mode][f"overlap@{args.top_k}"] = statistics.mean(
+                len(set(t) & set(b)) / len(b) for t, b in zip(top, baseline)
+            )
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import hashlib
+import io
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+import torch
+from PIL import Image
+
+
+def image_key(image_bytes: bytes, perceptual: bool = False) -> str:
+    """
+    Ключ изображения для кэша эмбеддингов.
+    :param image_bytes: Содержимое изображения в байтах.
+    :param perceptual: Использовать перцептивный хэш, чтобы перекодированные копии одного
+        изображения получали общий ключ.
+    :return: Ключ изображения.
+    """
+    if perceptual:
+        try:
+            image = Image.open(io.BytesIO(image_bytes))
+            # dhash only sees gradients, the coarse mean colour keeps flat images apart
+            colour = image.convert("RGB").resize((1, 1)).getpixel((0, 0))
+            return f"dhash-{dhash(image)}-{bytes(c >> 4 for c in colour).hex()}"
+        except Exception:
+            pass
+    return f"sha256-{hashlib.sha256(image_bytes).hexdigest()}"
+
+
+def query_key(text: str) -> str:
+    """
+    Ключ текстового запроса для кэша эмбеддингов: запросы, отличающиеся только
+    регистром, пробелами и формой записи символов, получают общий ключ.
+    :param text: Текст запроса.
+    :return: Ключ запроса.
+    """
+    normalized = " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+    return f"query-{hashlib.sha256(normalized.encode()).hexdigest()}"
+
+
+def dhash(image: Image.Image, size: int = 8) -> str:
+    """
+    Разностный хэш изображения: знаки перепадов яркости соседних пикселей уменьшенной копии.
+    :param image: Изображение.
+    :param size: Сторона сетки хэша; длина хэша - size * size бит.
+    :return: Хэш в шестнадцатеричном виде.
+    """
+    pixels = np.asarray(
+        image.convert("L").resize((size + 1, size), Image.Resampling.LANCZOS),
+        dtype=np.int16,
+    )
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes().hex()
+
+
+class EmbeddingCache:
+    """
+    LRU-кэш эмбеддингов в памяти с необязательным хранением на диске.
+    Дисковые записи разложены по имени модели, поэтому смена модели их не подхватывает.
+    """
+
+    def __init__(
+        self, max_size: int, directory: Optional[str] = None, namespace: str = ""
+    ):
+        """
+        Инициализация кэша.
+        :param max_size: Максимальное количество эмбеддингов в памяти.
+        :param directory: Каталог для хранения эмбеддингов на диске; без него кэш только в памяти.
+        :param namespace: Пространство имен ключей, обычно имя модели.
+        """
+        self.max_size = max_size
+        self._directory = (
+            os.path.join(directory, re.sub(r"[^\w.-]+", "_", namespace) or "default")
+            if directory
+            else None
+        )
+        self._items: "OrderedDict[str, Union[torch.Tensor, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[torch.Tensor]:
+        """
+        Возвращает эмбеддинг по ключу или None.
+        :param key: Ключ эмбеддинга.
+        :return: Тензор или None, если эмбеддинга нет в кэше.
+        """
+        with self._lock:
+            embedding = self._items.get(key)
+            if embedding is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+        if embedding is not None:
+            return self._tensor(embedding)
+
+        path = self._path(key)
+        if path and os.path.exists(path):
+            try:
+                # disk entries stay memory-mapped, so the LRU holds page cache, not heap
+                embedding = np.load(path, mmap_mode="r")
+            except (OSError, ValueError):
+                embedding = None
+            if embedding is not None:
+                self._remember(key, embedding)
+                with self._lock:
+                    self.hits += 1
+                return self._tensor(embedding)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, embedding: torch.Tensor) -> None:
+        """
+        Сохраняет эмбеддинг в памяти и, если задан каталог, на диске.
+        :param key: Ключ эмбеддинга.
+        :param embedding: Тензор на CPU.
+        """
+        self._remember(key, embedding)
+
+        path = self._path(key)
+        if path and not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write-then-rename, so a concurrent reader never sees a partial file
+            partial = f"{path}.{threading.get_ident()}.tmp"
+            with open(partial, "wb") as file:
+                np.save(file, embedding.numpy())
+            os.replace(partial, path)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+    @staticmethod
+    def _tensor(embedding: Union[torch.Tensor, np.ndarray]) -> torch.Tensor:
+        if isinstance(embedding, torch.Tensor):
+            return embedding
+        # a mapped entry is read-only, callers get their own copy
+        return torch.from_numpy(np.array(embedding))
+
+    def _remember(self, key: str, embedding: Union[torch.Tensor, np.ndarray]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = embedding
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def _path(self, key: str) -> Optional[str]:
+        if not self._directory:
+            return None
+        return os.path.join(self._directory, key[-2:], f"{key}.npy")
@@ -0,0 +1,441 @@
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# знаки конца предложения и закрывающие символы, которые могут стоять после них
+SENTENCE_ENDS = (".", "!", "?", "…")
+CLOSING = "\"'»”’)]"
+
+
+class DocumentTokens:
+    """
+    Слова и изображения документа в компактном виде: весь текст хранится одной строкой,
+    слова - параллельными массивами смещений, изображения - отдельным разреженным индексом.
+    Уже нарезанное начало документа отбрасывается, base - глобальный номер первого слова.
+    """
+
+    __slots__ = (
+        "base",
+        "_parts",
+        "_length",
+        "_text",
+        "starts",
+        "ends",
+        "units",
+        "image_positions",
+        "image_units",
+        "images",
+    )
+
+    def __init__(self) -> None:
+        self.base = 0
+        self._parts: List[str] = []
+        self._length = 0
+        self._text: Optional[str] = None
+        self.starts = array("I")
+        self.ends = array("I")
+        self.units = array("I")
+        self.image_positions = array("I")
+        self.image_units = array("I")
+        self.images: List[bytes] = []
+
+    @property
+    def word_count(self) -> int:
+        return len(self.starts)
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(self._parts)
+            self._parts = [self._text]
+        return self._text
+
+    def add_words(self, text: str, unit: int = 0) -> None:
+        """
+        Добавляет слова фрагмента текста в конец документа.
+        :param text: Фрагмент текста; разбивается на слова по пробельным символам.
+        :param unit: Номер страницы или слайда, к которому относится фрагмент.
+        """
+        words = text.split()
+        if not words:
+            return
+
+        # words are joined by single spaces, so any run of words is one slice of the text
+        offset = self._length + 1 if self._length else 0
+        for word in words:
+            self.starts.append(offset)
+            offset += len(word)
+            self.ends.append(offset)
+            offset += 1
+        self.units.extend([unit] * len(words))
+
+        if self._length:
+            self._parts.append(" ")
+        self._parts.append(" ".join(words))
+        self._length = offset - 1
+        self._text = None
+
+    def add_image(self, image: bytes, unit: int = 0) -> None:
+        """
+        Добавляет изображение перед следующим словом документа.
+        :param image: Содержимое изображения в байтах; хранится по ссылке, без копирования.
+        :param unit: Номер страницы или слайда, на котором находится изображение.
+        """
+        self.image_positions.append(self.base + self.word_count)
+        self.image_units.append(unit)
+        self.images.append(image)
+
+    def drop(self, words: int, images: int) -> None:
+        """
+        Отбрасывает начало документа.
+        :param words: Количество первых слов; не больше количества слов.
+        :param images: Количество первых изображений.
+        """
+        if words and words == self.word_count:
+            # e.g. an over-budget run without spaces was cut to the very last word
+            self._parts = []
+            self._length = 0
+            self._text = None
+            self.starts = array("I")
+            self.ends = array("I")
+            del self.units[:]
+            self.base += words
+        elif words:
+            shift = self.starts[words]
+            text = self.text[shift:]
+            self._parts = [text]
+            self._text = text
+            self._length -= shift
+            self.starts = array("I", [start - shift for start in self.starts[words:]])
+            self.ends = array("I", [end - shift for end in self.ends[words:]])
+            del self.units[:words]
+            self.base += words
+        if images:
+            del self.image_positions[:images]
+            del self.image_units[:images]
+            del self.images[:images]
+
+
+class Chunk:
+    """
+    Чанк документа: окно слов и изображения, которые к нему относятся.
+    """
+
+    __slots__ = (
+        "text",
+        "start_word",
+        "end_word",
+        "images",
+        "units",
+        "unit_name",
+        "token_count",
+    )
+
+    def __init__(
+        self,
+        text: str,
+        start_word: int,
+        end_word: int,
+        images: List[bytes],
+        units: List[int],
+        unit_name: Optional[str] = None,
+        token_count: Optional[int] = None,
+    ):
+        self.text = text
+        self.start_word = start_word
+        self.end_word = end_word
+        self.images = images
+        self.units = units
+        self.unit_name = unit_name
+        self.token_count = token_count
+
+    def metadata(self) -> Dict[str, Any]:
+        metadata: Dict[str, Any] = {
+            "start_word": self.start_word,
+            "end_word": self.end_word,
+        }
+        if self.unit_name:
+            metadata[self.unit_name] = self.units
+        if self.token_count is not None:
+            metadata["token_count"] = self.token_count
+        return metadata
+
+
+class BaseChunker:
+    """
+    Общая часть нарезчиков: буфер документа и сборка чанка из окна слов.
+    """
+
+    def __init__(self, unit_name: Optional[str] = None):
+        self.unit_name = unit_name
+        self.tokens = DocumentTokens()
+        # local index of the next window start and of the first unassigned image
+        self._start = 0
+        self._image = 0
+
+    def _chunk(
+        self,
+        end: int,
+        next_start: int,
+        last: bool,
+        token_count: Optional[int] = None,
+    ) -> Chunk:
+        """
+        Собирает чанк из слов от текущего начала окна до end и сдвигает окно.
+        Изображения до начала следующего окна относятся к этому чанку,
+        последний чанк забирает все оставшиеся.
+        """
+        tokens = self.tokens
+        start = self._start
+
+        first_image = self._image
+        boundary = tokens.base + next_start
+        while self._image < len(tokens.images) and (
+            last or tokens.image_positions[self._image] < boundary
+        ):
+            self._image += 1
+
+        units = set(tokens.units[start:end])
+        units.update(tokens.image_units[first_image : self._image])
+
+        self._start = next_start
+        return Chunk(
+            tokens.text[tokens.starts[start] : tokens.ends[end - 1]]
+            if end > start
+            else "",
+            tokens.base + start,
+            tokens.base + end,
+            tokens.images[first_image : self._image],
+            sorted(units),
+            self.unit_name,
+            token_count,
+        )
+
+    def _drop(self) -> None:
+        self.tokens.drop(self._start, self._image)
+        self._start = 0
+        self._image = 0
+
+
+class Chunker(BaseChunker):
+    """
+    Инкрементальная нарезка документа на перекрывающиеся окна слов.
+    Процессор дописывает слова и изображения в tokens по мере разбора, а готовые окна
+    забираются через ready(); нарезанное начало документа сразу отбрасывается,
+    поэтому память ограничена окном и одной страницей, а не размером документа.
+    Каждое изображение попадает ровно в один чанк - тот, в шаге которого оно стоит.
+    """
+
+    def __init__(self, chunk_size: int, overlap: int, unit_name: Optional[str] = None):
+        """
+        Инициализация нарезчика.
+        :param chunk_size: Максимальное количество слов в одном чанке.
+        :param overlap: Количество слов, которые перекрываются между чанками.
+        :param unit_name: Ключ метаданных для номеров страниц или слайдов чанка.
+        """
+        if chunk_size - overlap < 1:
+            raise ValueError("Перекрытие должно быть меньше размера чанка.")
+        super().__init__(unit_name)
+        self.chunk_size = chunk_size
+        self.step = chunk_size - overlap
+
+    def ready(self) -> Iterator[Chunk]:
+        """
+        Отдает окна, за которыми в документе уже есть слова, то есть точно не последние.
+        """
+        while self.tokens.word_count > self._start + self.chunk_size:
+            yield self._cut(last=False)
+        self._drop()
+
+    def finish(self) -> Iterator[Chunk]:
+        """
+        Отдает оставшиеся окна после окончания разбора документа.
+        """
+        yield from self.ready()
+        if self.tokens.word_count or self.tokens.images:
+            yield self._cut(last=True)
+
+    def _cut(self, last: bool) -> Chunk:
+        start = self._start
+        end = min(start + self.chunk_size, self.tokens.word_count)
+        return self._chunk(end, start + self.step, last)
+
+
+class TokenCounter:
+    """
+    Считает токены слов токенизатором эмбеддера. Токенизатор Qwen2 не склеивает
+    токены через пробел, поэтому длина текста - сумма длин его слов с ведущим пробелом.
+    """
+
+    def __init__(self, tokenizer: Callable[[], Any], cache_size: int = 65536):
+        """
+        Инициализация счетчика.
+        :param tokenizer: Функция, возвращающая токенизатор; вызывается при первом подсчете.
+        :param cache_size: Количество слов, длина которых запоминается.
+        """
+        self._tokenizer = tokenizer
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, words: List[str]) -> List[int]:
+        """
+        Количество токенов каждого слова.
+        :param words: Список слов.
+        :return: Список длин в токенах в порядке входа.
+        """
+        with self._lock:
+            known = {}
+            for word in words:
+                if word in self._cache:
+                    self._cache.move_to_end(word)
+                    known[word] = self._cache[word]
+
+        missing = [word for word in dict.fromkeys(words) if word not in known]
+        if missing:
+            ids = self._tokenizer()(
+                [f" {word}" for word in missing], add_special_tokens=False
+            )["input_ids"]
+            with self._lock:
+                for word, word_ids in zip(missing, ids):
+                    known[word] = self._cache[word] = len(word_ids)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return [known[word] for word in words]
+
+
+class TokenChunker(BaseChunker):
+    """
+    Нарезка документа по бюджету токенов эмбеддера вместо количества слов.
+    Целые предложения упаковываются в чанк, пока он помещается в max_tokens;
+    перекрытие - последние предложения чанка общей длиной не больше overlap_tokens.
+    Конец абзаца, страницы или слайда (каждый вызов ready()) тоже завершает предложение.
+    Предложение длиннее бюджета режется по словам. Интерфейс совпадает с Chunker.
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[List[str]], List[int]],
+        max_tokens: int,
+        overlap_tokens: int,
+        unit_name: Optional[str] = None,
+    ):
+        """
+        Инициализация нарезчика.
+        :param count_tokens: Функция, возвращающая количество токенов каждого слова.
+        :param max_tokens: Максимальное количество токенов в одном чанке.
+        :param overlap_tokens: Максимальное количество токенов перекрытия между чанками.
+        :param unit_name: Ключ метаданных для номеров страниц или слайдов чанка.
+        """
+        if overlap_tokens >= max_tokens:
+            raise ValueError("Перекрытие должно быть меньше размера чанка.")
+        super().__init__(unit_name)
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        # token count of every buffered word and global indices of block-ending words
+        self._counts = array("I")
+        self._breaks: set[int] = set()
+
+    def ready(self) -> Iterator[Chunk]:
+        """
+        Отдает чанки, которые следующие слова документа уже не изменят.
+        """
+        self._measure()
+        while (window := self._window(last=False)) is not None:
+            yield self._cut(*window, last=False)
+
+        del self._counts[: self._start]
+        self._drop()
+        self._breaks = {i for i in self._breaks if i >= self.tokens.base}
+
+    def finish(self) -> Iterator[Chunk]:
+        """
+        Отдает оставшиеся чанки после окончания разбора документа.
+        """
+        yield from self.ready()
+        word_count = self.tokens.word_count
+        while self._start < word_count:
+            end, next_start = self._window(last=True)
+            if end == word_count:
+                break
+            yield self._cut(end, next_start, last=False)
+        if word_count > self._start or self._image < len(self.tokens.images):
+            yield self._cut(word_count, word_count, last=True)
+
+    def _measure(self) -> None:
+        tokens = self.tokens
+        first, word_count = len(self._counts), tokens.word_count
+        if first == word_count:
+            return
+        text = tokens.text
+        self._counts.extend(
+            self.count_tokens(
+                [
+                    text[tokens.starts[i] : tokens.ends[i]]
+                    for i in range(first, word_count)
+                ]
+            )
+        )
+        self._breaks.add(tokens.base + word_count - 1)
+
+    def _ends_sentence(self, word: int) -> bool:
+        tokens = self.tokens
+        if tokens.base + word in self._breaks:
+            return True
+        text = tokens.text[tokens.starts[word] : tokens.ends[word]].rstrip(CLOSING)
+        return text.endswith(SENTENCE_ENDS)
+
+    def _window(self, last: bool) -> Optional[Tuple[int, int]]:
+        """
+        Конец текущего окна и начало следующего или None, если для решения нужны
+        следующие слова документа.
+        """
+        word_count = self.tokens.word_count
+        start = self._start
+        total = 0
+        sentences: List[int] = []
+
+        word = start
+        while word < word_count:
+            end, size = word, 0
+            while end < word_count:
+                size += self._counts[end]
+                end += 1
+                if self._ends_sentence(end - 1):
+                    break
+
+            if total + size > self.max_tokens:
+                if sentences:
+                    return word, self._overlap(sentences, word)
+                return self._split_sentence()
+            # the sentence may still grow with the next words
+            if not last and not self._ends_sentence(end - 1):
+                return None
+            sentences.append(word)
+            total += size
+            word = end
+
+        return (word_count, word_count) if last else None
+
+    def _overlap(self, sentences: List[int], end: int) -> int:
+        # the next window repeats the longest tail of whole sentences within the overlap
+        for sentence in sentences[1:]:
+            if sum(self._counts[sentence:end]) <= self.overlap_tokens:
+                return sentence
+        return end
+
+    def _split_sentence(self) -> Tuple[int, int]:
+        end, total = self._start, 0
+        while end < self.tokens.word_count and (
+            end == self._start or total + self._counts[end] <= self.max_tokens
+        ):
+            total += self._counts[end]
+            end += 1
+        return end, end
+
+    def _cut(self, end: int, next_start: int, last: bool) -> Chunk:
+        start = self._start
+        return self._chunk(end, next_start, last, sum(self._counts[start:end]))
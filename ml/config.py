@@ -7,3 +7,16 @@ class ModelKwargs(BaseModel):
     top_p: float | None = Field(default=0.9)
     max_tokens: int | None = Field(default=8192, ge=1, le=8192)
     repeat_penalty: float = Field(default=1.1)
+
+
+class PageRenderOptions(BaseModel):
+    # off, auto (pages chosen by text density and vector drawings) or all
+    mode: str = Field(default="off")
+    dpi: int = Field(default=96, ge=36, le=600)
+    # auto mode renders pages with fewer text characters per 1000 pt² than this
+    max_text_density: float = Field(default=2.0)
+    # ... or with at least this many vector paths (charts, schemes, drawn tables)
+    min_drawings: int = Field(default=20)
+    # a page this much covered by one raster image is already embedded as that image
+    max_image_coverage: float = Field(default=0.8)
+    cache_dir: str = Field(default="")
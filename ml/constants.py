@@ -1,4 +1,5 @@
 COLPALI_MODEL_NAME = "vidore/colqwen2-v0.1"
+EMBEDDING_DIM = 128
 LLM_PATH = "ml/models/model-q8_0.gguf"
 
 SYSTEM_PROMPT = """
@@ -16,5 +17,7 @@ SYSTEM_PROMPT = """
 Не придумывай факты; все ответы должны основываться на достоверной информации, извлеченной из контекста.
 Всегда отвечай на запросы на русском языке.
 Если ты не знаешь ответ, то честно укажи, что не знаешь ответ.
-КОНТЕКСТ: {}
 """
+
+# kept out of SYSTEM_PROMPT so the system prompt stays a static, cacheable prefix
+CONTEXT_PROMPT = """КОНТЕКСТ: {}"""
@@ -0,0 +1,447 @@
+import io
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Generic, List, Optional, Tuple, TypeVar
+
+import numpy as np
+import torch
+from loguru import logger
+from PIL import Image, ImageOps
+
+from ml.cache import EmbeddingCache, image_key, query_key
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# ColQwen2Processor.process_queries wraps every query as "Query: " + text + 10 x
+# <|endoftext|>; these rows are the same in every query embedding
+QUERY_PREFIX_TOKENS = 2
+QUERY_AUGMENTATION_TOKENS = 10
+
+
+def mean_pool(embedding: torch.Tensor) -> torch.Tensor:
+    """
+    Сводит мультивектор к одному нормированному вектору для первичного ANN-поиска.
+    :param embedding: Тензор (количество токенов, размерность).
+    :return: Тензор (размерность).
+    """
+    pooled = embedding.mean(dim=0)
+    return pooled / pooled.norm().clamp_min(1e-12)
+
+
+def question_tokens(embedding: torch.Tensor) -> torch.Tensor:
+    """
+    Векторы токенов самого вопроса: без префикса запроса и токенов аугментации,
+    которые одинаковы во всех запросах.
+    :param embedding: Тензор запроса (количество токенов, размерность).
+    :return: Тензор (количество токенов вопроса, размерность).
+    """
+    end = len(embedding) - QUERY_AUGMENTATION_TOKENS
+    if end <= QUERY_PREFIX_TOKENS:
+        return embedding
+    return embedding[QUERY_PREFIX_TOKENS:end]
+
+
+def query_similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """
+    Симметричный MaxSim двух запросов, нормированный на количество токенов:
+    каждый токен одного запроса должен найти близкий токен в другом.
+    :param first: Векторы токенов первого вопроса (количество токенов, размерность).
+    :param second: Векторы токенов второго вопроса.
+    :return: Сходство от -1 до 1.
+    """
+    scores = first @ second.T
+    return float(min(scores.max(axis=1).mean(), scores.max(axis=0).mean()))
+
+
+def prepare_image(image_bytes: bytes, max_pixels: int = 0) -> Image.Image:
+    """
+    Декодирует изображение для эмбеддинга: поворот по EXIF, RGB и уменьшение до
+    бюджета пикселей, от которого зависит количество патчей и векторов.
+    :param image_bytes: Содержимое изображения в байтах.
+    :param max_pixels: Максимальная площадь изображения в пикселях; 0 - без ограничения.
+    :return: Изображение в режиме RGB.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    if 0 < max_pixels < width * height:
+        scale = (max_pixels / (width * height)) ** 0.5
+        # JPEG is decoded right at a reduced scale instead of at full size
+        image.draft("RGB", (int(width * scale), int(height * scale)))
+
+    if image.getexif().get(0x0112, 1) != 1:
+        image = ImageOps.exif_transpose(image)
+
+    if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+        # transparent areas become white, as they look in the document
+        rgba = image.convert("RGBA")
+        image = Image.new("RGB", rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.getchannel("A"))
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    width, height = image.size
+    if 0 < max_pixels < width * height:
+        scale = (max_pixels / (width * height)) ** 0.5
+        image = image.resize(
+            (max(1, int(width * scale)), max(1, int(height * scale))),
+            Image.Resampling.BICUBIC,
+            reducing_gap=3.0,
+        )
+    # Image.open is lazy: broken data must fail here, not inside the processor
+    image.load()
+    return image
+
+
+def quantize_dynamic(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Динамическая int8-квантизация линейных слоев для инференса на CPU:
+    веса хранятся в int8, активации квантуются на лету.
+    :param model: Модель в float32 на CPU.
+    :return: Квантизованная модель.
+    """
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def dump_embeddings(embeddings: List[Optional[torch.Tensor]]) -> bytes:
+    """
+    Сериализует эмбеддинги для передачи между процессами.
+    :param embeddings: Список тензоров на CPU; None - изображение не удалось декодировать.
+    :return: Несжатый npz-архив в байтах.
+    """
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        *(
+            embedding.numpy()
+            if embedding is not None
+            else np.empty((0, 0), dtype=np.float32)
+            for embedding in embeddings
+        ),
+    )
+    return buffer.getvalue()
+
+
+def load_embeddings(content: bytes) -> List[Optional[torch.Tensor]]:
+    """
+    Восстанавливает эмбеддинги, сериализованные dump_embeddings.
+    :param content: npz-архив в байтах.
+    :return: Список тензоров в исходном порядке; пустые массивы снова становятся None.
+    """
+    with np.load(io.BytesIO(content)) as archive:
+        arrays = [archive[f"arr_{i}"] for i in range(len(archive.files))]
+    return [torch.from_numpy(array) if array.size else None for array in arrays]
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Собирает одиночные конкурентные вызовы в батчи и выполняет их одним вызовом.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[T]], List[R]],
+        max_batch_size: int = 16,
+        max_wait_ms: int = 10,
+        name: str = "micro-batcher",
+    ):
+        """
+        Инициализация микро-батчера.
+        :param fn: Функция, обрабатывающая список входов и возвращающая список результатов той же длины.
+        :param max_batch_size: Максимальный размер батча.
+        :param max_wait_ms: Максимальное время ожидания добора батча в миллисекундах.
+        :param name: Имя фонового потока.
+        """
+        if max_batch_size < 1:
+            raise ValueError("Размер батча должен быть положительным.")
+        self._fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._name = name
+        self._queue: "queue.Queue[Tuple[T, Future]]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, item: T) -> "Future[R]":
+        """
+        Ставит элемент в очередь и возвращает future с результатом.
+        :param item: Входной элемент.
+        :return: Future с результатом обработки элемента.
+        """
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: T) -> R:
+        return self.submit(item).result()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=self._name, daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self) -> List[Tuple[T, Future]]:
+        """
+        Блокируется до первого элемента, затем добирает батч до лимита размера или времени.
+        Элементы, чьи future уже отменены, отбрасываются; батч может оказаться пустым.
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        # a running future can no longer be cancelled by a disconnected caller,
+        # so setting its result below never raises InvalidStateError
+        return [
+            (item, future)
+            for item, future in batch
+            if future.set_running_or_notify_cancel()
+        ]
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            futures = [future for _, future in batch]
+            try:
+                results = self._fn([item for item, _ in batch])
+            except Exception as e:
+                logger.error(f"{self._name} - batch failed: {e}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for future, result in zip(futures, results):
+                future.set_result(result)
+            for future in futures[len(results) :]:
+                future.set_exception(
+                    RuntimeError(
+                        f"{self._name} - batch returned {len(results)} results"
+                    )
+                )
+
+
+class EmbeddingEngine:
+    """
+    Батчевый движок эмбеддингов ColQwen2.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        processor: Any,
+        device: str,
+        max_batch_size: int = 16,
+        max_wait_ms: int = 10,
+        image_cache: EmbeddingCache | None = None,
+        perceptual_hash: bool = False,
+        query_cache: EmbeddingCache | None = None,
+        pin_memory: bool = False,
+        max_image_pixels: int = 0,
+        preprocess_executor: Optional[Executor] = None,
+    ):
+        """
+        Инициализация движка.
+        :param model: Модель ColQwen2.
+        :param processor: Процессор ColQwen2.
+        :param device: Устройство, на котором выполняется модель.
+        :param max_batch_size: Максимальное количество элементов в одном прямом проходе.
+        :param max_wait_ms: Максимальное время ожидания добора батча одиночных вызовов.
+        :param image_cache: Кэш эмбеддингов изображений, общий для всех документов.
+        :param perceptual_hash: Считать одинаковыми изображения с совпадающим перцептивным хэшем.
+        :param query_cache: Кэш эмбеддингов текстовых запросов поиска.
+        :param pin_memory: Копировать входы в закрепленную память, чтобы передача на GPU
+            шла асинхронно.
+        :param max_image_pixels: Бюджет пикселей изображения перед процессором; 0 - без ограничения.
+        :param preprocess_executor: Пул потоков для декодирования и уменьшения изображений батча.
+        """
+        self.model = model
+        self.processor = processor
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.image_cache = image_cache
+        self.perceptual_hash = perceptual_hash
+        self.query_cache = query_cache
+        self.pin_memory = pin_memory
+        self.max_image_pixels = max_image_pixels
+        self.preprocess_executor = preprocess_executor
+        # bulk batches run on executor threads next to the micro-batcher threads,
+        # while the model only takes one forward pass at a time
+        self._forward_lock = threading.Lock()
+
+        self._text_batcher = MicroBatcher(
+            self._embed_texts_batch, max_batch_size, max_wait_ms, "text-embedder"
+        )
+        self._image_batcher = MicroBatcher(
+            self._embed_images_batch, max_batch_size, max_wait_ms, "image-embedder"
+        )
+
+    def embed_text(self, text: str) -> torch.Tensor:
+        """
+        Эмбеддинг одного текста; конкурентные вызовы объединяются в общий батч.
+        :param text: Текст запроса.
+        :return: Тензор (количество токенов, размерность).
+        """
+        return self.submit_text(text).result()
+
+    def embed_image(self, image_bytes: bytes) -> Optional[torch.Tensor]:
+        """
+        Эмбеддинг одного изображения; конкурентные вызовы объединяются в общий батч.
+        :param image_bytes: Содержимое изображения в байтах.
+        :return: Тензор (количество патчей, размерность) или None, если изображение
+            не удалось декодировать.
+        """
+        return self._image_batcher(image_bytes)
+
+    def submit_text(self, text: str) -> "Future[torch.Tensor]":
+        """
+        Неблокирующий вариант embed_text; эмбеддинг из кэша запросов возвращается сразу.
+        :param text: Текст запроса.
+        :return: Future с тензором (количество токенов, размерность).
+        """
+        if self.query_cache is None:
+            return self._text_batcher.submit(text)
+
+        key = query_key(text)
+        future: Future = Future()
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            future.set_result(cached)
+            return future
+
+        future = self._text_batcher.submit(text)
+        future.add_done_callback(lambda done: self._remember_query(key, done))
+        return future
+
+    def _remember_query(self, key: str, future: "Future[torch.Tensor]") -> None:
+        if future.exception() is None:
+            self.query_cache.put(key, future.result())
+
+    def submit_image(self, image_bytes: bytes) -> "Future[Optional[torch.Tensor]]":
+        """
+        Неблокирующий вариант embed_image.
+        :param image_bytes: Содержимое изображения в байтах.
+        :return: Future с тензором (количество патчей, размерность) или None.
+        """
+        return self._image_batcher.submit(image_bytes)
+
+    def embed_texts(
+        self, texts: List[str], lengths: Optional[List[Optional[int]]] = None
+    ) -> List[torch.Tensor]:
+        """
+        Эмбеддинги списка текстов, по max_batch_size за один прямой проход.
+        Тексты близкой длины попадают в один проход, чтобы батч почти не дополнялся паддингом.
+        :param texts: Список текстов.
+        :param lengths: Длины текстов в токенах, посчитанные при нарезке; если длина
+            известна не для всех текстов, тексты сортируются по количеству символов.
+        :return: Список тензоров (количество токенов, размерность) в порядке входа.
+        """
+        # padding depends on token counts, characters are only a fallback
+        if lengths is None or None in lengths:
+            lengths = [len(text) for text in texts]
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+        embeddings = self._split([texts[i] for i in order], self._embed_texts_batch)
+
+        result: List[torch.Tensor] = [None] * len(texts)
+        for i, embedding in zip(order, embeddings):
+            result[i] = embedding
+        return result
+
+    def embed_images(self, images: List[bytes]) -> List[Optional[torch.Tensor]]:
+        """
+        Эмбеддинги списка изображений, по max_batch_size за один прямой проход.
+        Повторяющиеся изображения и изображения из кэша через модель не проходят.
+        :param images: Список изображений в байтах.
+        :return: Список тензоров (количество патчей, размерность) в порядке входа;
+            None на месте изображений, которые не удалось декодировать.
+        """
+        keys = [image_key(image, self.perceptual_hash) for image in images]
+        unique = dict(zip(keys, images))
+
+        embeddings = {
+            key: self.image_cache.get(key) if self.image_cache else None
+            for key in unique
+        }
+        missing = [key for key, embedding in embeddings.items() if embedding is None]
+        computed = self._split(
+            [unique[key] for key in missing], self._embed_images_batch
+        )
+        for key, embedding in zip(missing, computed):
+            embeddings[key] = embedding
+            if self.image_cache and embedding is not None:
+                self.image_cache.put(key, embedding)
+
+        return [embeddings[key] for key in keys]
+
+    def _split(
+        self, items: List[T], fn: Callable[[List[T]], List[Optional[torch.Tensor]]]
+    ) -> List[Optional[torch.Tensor]]:
+        embeddings = []
+        for start in range(0, len(items), self.max_batch_size):
+            embeddings.extend(fn(items[start : start + self.max_batch_size]))
+        return embeddings
+
+    def _embed_texts_batch(self, texts: List[str]) -> List[torch.Tensor]:
+        return self._forward(self.processor.process_queries(texts))
+
+    def _embed_images_batch(self, images: List[bytes]) -> List[Optional[torch.Tensor]]:
+        # only one batch of bounded images is held decoded at a time
+        if self.preprocess_executor and len(images) > 1:
+            prepared = list(self.preprocess_executor.map(self._prepare, images))
+        else:
+            prepared = [self._prepare(image) for image in images]
+
+        decoded = [image for image in prepared if image is not None]
+        if not decoded:
+            return [None] * len(images)
+        try:
+            batch = self.processor.process_images(decoded)
+        finally:
+            for image in decoded:
+                image.close()
+        embeddings = iter(self._forward(batch))
+        return [next(embeddings) if image is not None else None for image in prepared]
+
+    def _prepare(self, image_bytes: bytes) -> Optional[Image.Image]:
+        # one image Pillow cannot decode (EMF, JBIG2, ...) must not fail the whole batch
+        try:
+            return prepare_image(image_bytes, self.max_image_pixels)
+        except Exception as e:
+            logger.warning(
+                f"Embedding - image of {len(image_bytes)} bytes skipped: {e}"
+            )
+            return None
+
+    def _forward(self, batch: Any) -> List[torch.Tensor]:
+        """
+        Один прямой проход по дополненному батчу; паддинг отрезается по attention_mask.
+        Проходы из разных потоков выполняются по очереди.
+        """
+        with self._forward_lock, torch.inference_mode():
+            if self.pin_memory:
+                for key, value in batch.items():
+                    batch[key] = value.pin_memory()
+            batch = batch.to(self.device, non_blocking=self.pin_memory)
+            embeddings = self.model(**batch)
+
+            mask = batch["attention_mask"].bool()
+            return [
+                embedding[row_mask].float().cpu()
+                for embedding, row_mask in zip(embeddings, mask)
+            ]
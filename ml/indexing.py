@@ -1,305 +1,477 @@
-from typing import Generator, Dict, Any, List
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
 from io import BytesIO
-import base64
+import hashlib
+import os
+import posixpath
+import tempfile
+import zipfile
 
-from docx import Document
-from docx.text.paragraph import Paragraph
-from docx.table import Table
-from docx.oxml.text.paragraph import CT_P
-from docx.oxml.table import CT_Tbl
+from loguru import logger
+from lxml import etree
 
 from pptx import Presentation
 from pptx.enum.shapes import MSO_SHAPE_TYPE
 
 import fitz
+from PIL import Image
 
+from ml.chunking import BaseChunker, Chunk, Chunker, DocumentTokens
+from ml.config import PageRenderOptions
 
-class DocxProcessor:
+
+class BaseProcessor(ABC):
     """
-    Класс для обработки .docx файлов, включая извлечение текста и изображений.
+    Базовый процессор: извлекает слова и изображения документа и нарезает их на чанки
+    по ходу разбора, не дожидаясь конца документа.
     """
 
-    def __init__(self, chunk_size: int = 100, overlap: int = 25):
+    # ключ метаданных чанка для номеров страниц или слайдов
+    unit_name: Optional[str] = None
+
+    def __init__(
+        self,
+        chunk_size: int = 100,
+        overlap: int = 25,
+        min_image_pixels: int = 0,
+        chunker: Optional[Callable[[Optional[str]], BaseChunker]] = None,
+    ):
         """
         Инициализация процессора.
         :param chunk_size: Максимальное количество слов в одном чанке.
         :param overlap: Количество слов, которые перекрываются между чанками.
+        :param min_image_pixels: Минимальная площадь изображения в пикселях; изображения
+            меньше нее (иконки, разделители) пропускаются.
+        :param chunker: Фабрика нарезчика по unit_name, например TokenChunker;
+            без нее документ режется на окна по chunk_size слов.
         """
         self.chunk_size = chunk_size
         self.overlap = overlap
+        self.min_image_pixels = min_image_pixels
+        self.chunker = chunker
 
-    def process(self, file_bytes: bytes) -> Generator[Dict[str, Any], None, None]:
+    def process(self, file_bytes: bytes) -> Iterator[Chunk]:
         """
-        Обрабатывает .docx файл и возвращает чанки текста с метаданными.
-        :param file_bytes: Содержимое .docx файла в байтах.
-        :return: Генератор чанков текста с метаданными.
+        Обрабатывает файл и возвращает чанки текста с метаданными.
+        :param file_bytes: Содержимое файла в байтах.
+        :return: Генератор чанков.
         """
-        document = self._load_document(file_bytes)
-        tokens, total_words = self._extract_tokens_with_positions(document)
-        yield from self._generate_chunks_with_metadata(tokens, total_words)
+        chunker = (
+            self.chunker(self.unit_name)
+            if self.chunker
+            else Chunker(self.chunk_size, self.overlap, self.unit_name)
+        )
+        for _ in self._extract_tokens(file_bytes, chunker.tokens):
+            yield from chunker.ready()
+        yield from chunker.finish()
+
+    def _add_image(self, tokens: DocumentTokens, image_bytes: bytes, unit: int = 0):
+        if self.min_image_pixels > 0:
+            try:
+                # only the header is read here, pixels are not decoded
+                width, height = Image.open(BytesIO(image_bytes)).size
+            except Exception:
+                return
+            if width * height < self.min_image_pixels:
+                return
+        # the bytes object is passed on as is, up to the embedder
+        tokens.add_image(image_bytes, unit)
+
+    @abstractmethod
+    def _extract_tokens(
+        self, file_bytes: bytes, tokens: DocumentTokens
+    ) -> Iterator[None]:
+        """
+        Дописывает слова и изображения документа в tokens в порядке их следования.
+        :param file_bytes: Содержимое файла в байтах.
+        :param tokens: Буфер, в который дописываются слова и изображения.
+        :return: Генератор, отдающий управление после каждого абзаца, страницы или слайда.
+        """
+
+
+# пространства имен OOXML, которые читает DocxProcessor
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+V = "{urn:schemas-microsoft-com:vml}"
+MC = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+PR = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+OFFICE_DOCUMENT = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+)
+
+
+def read_relationships(
+    archive: zipfile.ZipFile, part: str, rel_type: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    Читает связи части пакета OOXML.
+    :param archive: Открытый .docx архив.
+    :param part: Имя части, например word/document.xml; пустая строка - сам пакет.
+    :param rel_type: Оставить только связи этого типа.
+    :return: Отображение rId в имя целевой части архива; внешние ссылки пропускаются.
+    """
+    directory, name = posixpath.split(part)
+    try:
+        content = archive.read(posixpath.join(directory, "_rels", f"{name}.rels"))
+    except KeyError:
+        return {}
+
+    targets = {}
+    parser = etree.XMLParser(resolve_entities=False, no_network=True)
+    for relationship in etree.fromstring(content, parser).iter(f"{PR}Relationship"):
+        if relationship.get("TargetMode") == "External":
+            continue
+        if rel_type and relationship.get("Type") != rel_type:
+            continue
+        target = relationship.get("Target", "")
+        targets[relationship.get("Id")] = (
+            target.lstrip("/")
+            if target.startswith("/")
+            else posixpath.normpath(posixpath.join(directory, target))
+        )
+    return targets
 
-    def _load_document(self, file_bytes: bytes) -> Document:
+
+class DocxProcessor(BaseProcessor):
+    """
+    Класс для обработки .docx файлов, включая извлечение текста и изображений.
+
+    word/document.xml читается потоково через iterparse: разобранные элементы
+    сразу удаляются, поэтому память не растет с размером документа. Текст таблиц
+    извлекается вместе с абзацами в порядке следования.
+    """
+
+    def _extract_tokens(
+        self, file_bytes: bytes, tokens: DocumentTokens
+    ) -> Iterator[None]:
         """
-        Загружает .docx документ из байтов.
+        Извлекает текст и изображения из документа по абзацам.
         :param file_bytes: Содержимое .docx файла в байтах.
-        :return: Объект документа.
-        """
-        return Document(BytesIO(file_bytes))
+        :param tokens: Буфер, в который дописываются слова и изображения.
+        """
+        with zipfile.ZipFile(BytesIO(file_bytes)) as archive:
+            documents = read_relationships(archive, "", OFFICE_DOCUMENT)
+            part = next(iter(documents.values()), "word/document.xml")
+            # every rId of the body resolved once, image parts are read on use
+            images = read_relationships(archive, part)
+
+            # runs nest through text boxes, each open run collects its text and images
+            runs: List[Tuple[List[str], List[str]]] = []
+            fallback = 0
+
+            with archive.open(part) as source:
+                # the upload is untrusted: entities stay unexpanded and libxml2
+                # keeps its size limits
+                for event, element in etree.iterparse(
+                    source,
+                    events=("start", "end"),
+                    resolve_entities=False,
+                    no_network=True,
+                ):
+                    tag = element.tag
+                    if event == "start":
+                        if tag == f"{W}r":
+                            runs.append(([], []))
+                        elif tag == f"{MC}Fallback":
+                            fallback += 1
+                        continue
+
+                    if tag == f"{MC}Fallback":
+                        # the same content as the Choice next to it, in legacy markup
+                        fallback -= 1
+                    elif fallback or not runs:
+                        pass
+                    elif tag == f"{W}t":
+                        runs[-1][0].append(element.text or "")
+                    elif tag == f"{W}tab":
+                        runs[-1][0].append("\t")
+                    elif tag in (f"{W}br", f"{W}cr"):
+                        runs[-1][0].append("\n")
+                    elif tag == f"{A}blip":
+                        runs[-1][1].append(element.get(f"{R}embed"))
+                    elif tag == f"{V}imagedata":
+                        runs[-1][1].append(element.get(f"{R}id"))
+
+                    if tag == f"{W}r":
+                        text, rel_ids = runs.pop()
+                        if not fallback:
+                            for rel_id in rel_ids:
+                                if rel_id in images:
+                                    self._add_image(
+                                        tokens, archive.read(images[rel_id])
+                                    )
+                            tokens.add_words("".join(text))
+                    elif tag in (f"{W}p", f"{W}tr", f"{W}tbl"):
+                        element.clear()
+                        # drop finished siblings too, so the tree never holds the whole body
+                        parent = element.getparent()
+                        while parent is not None and element.getprevious() is not None:
+                            del parent[0]
+                        if tag == f"{W}p" and not fallback:
+                            yield
+
+
+def read_pdf_page(
+    pdf_document,
+    page_number: int,
+    render: Optional[PageRenderOptions] = None,
+    document_hash: str = "",
+) -> Tuple[str, List[bytes]]:
+    """
+    Извлекает текст и изображения одной страницы PDF.
+    :param pdf_document: Открытый документ PyMuPDF.
+    :param page_number: Номер страницы, начиная с нуля.
+    :param render: Настройки рендера страниц; отрендеренная страница добавляется
+        последним изображением.
+    :param document_hash: Хэш содержимого PDF - ключ кэша рендеров.
+    :return: Текст страницы и изображения в байтах.
+    """
+    page = pdf_document[page_number]
+    images = []
+
+    # Извлечение изображений
+    for img in page.get_images(full=True):
+        xref = img[0]
+        try:
+            images.append(pdf_document.extract_image(xref)["image"])
+        except Exception as e:
+            logger.warning(
+                f"PDF - page {page_number + 1}: image {xref} extraction failed: {e}"
+            )
 
-    def iter_block_items(self, parent):
-        """
-        Возвращает параграфы и таблицы в порядке их следования в документе.
-        """
-        parent_elm = parent.element.body
-        for child in parent_elm.iterchildren():
-            if isinstance(child, CT_P):
-                yield Paragraph(child, parent)
-            elif isinstance(child, CT_Tbl):
-                yield Table(child, parent)
-
-    def run_has_image(self, run):
-        """
-        Проверяет, содержит ли run изображение.
-        """
-        r_element = run._r
-        drawing_elements = r_element.findall(
-            ".//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}drawing"
-        )
-        return bool(drawing_elements)
+    text = page.get_text()
+    if render and should_render(page, text, render):
+        images.append(render_page(page, page_number, render, document_hash))
+    return text, images
 
-    def extract_image_from_run(self, run):
-        """
-        Извлекает изображение из run.
-        """
-        r_element = run._r
-        drawing_elements = r_element.findall(
-            ".//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}drawing"
+
+def should_render(page, text: str, render: PageRenderOptions) -> bool:
+    """
+    Решает, стоит ли страница визуального эмбеддинга.
+    :param page: Страница PyMuPDF.
+    :param text: Текст страницы.
+    :param render: Настройки рендера страниц.
+    :return: True, если страницу нужно отрендерить.
+    """
+    if render.mode == "all":
+        return True
+    if render.mode != "auto":
+        return False
+
+    area = page.rect.width * page.rect.height or 1
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        # a scan: its image is embedded anyway, a render would add nothing
+        if (x1 - x0) * (y1 - y0) / area >= render.max_image_coverage:
+            return False
+
+    drawings = len(page.get_cdrawings())
+    if drawings >= render.min_drawings:
+        return True
+    characters = len("".join(text.split()))
+    # empty pages need nothing, dense text is served well by the text embedding
+    if not characters and not drawings:
+        return False
+    return characters * 1000 / area < render.max_text_density
+
+
+def render_page(
+    page, page_number: int, render: PageRenderOptions, document_hash: str = ""
+) -> bytes:
+    """
+    Рендерит страницу в PNG; при заданном каталоге кэша рендер берется из него.
+    :param page: Страница PyMuPDF.
+    :param page_number: Номер страницы, начиная с нуля.
+    :param render: Настройки рендера страниц.
+    :param document_hash: Хэш содержимого PDF; без него кэш не используется.
+    :return: Изображение страницы в байтах.
+    """
+    path = None
+    if render.cache_dir and document_hash:
+        path = os.path.join(
+            render.cache_dir,
+            document_hash[:2],
+            f"{document_hash}-{page_number}-{render.dpi}.png",
         )
-        for drawing in drawing_elements:
-            blip_elements = drawing.findall(
-                ".//{http://schemas.openxmlformats.org/drawingml/2006/main}blip"
-            )
-            if blip_elements:
-                embed = blip_elements[0].get(
-                    "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed"
-                )
-                image_part = run.part.related_parts[embed]
-                image_bytes = image_part.blob
-                return image_bytes
-        return None
-
-    def _extract_tokens_with_positions(
-        self, document: Document
-    ) -> (List[Dict[str, Any]], int):
-        """
-        Извлекает текст и изображения из документа в порядке их следования, с позициями.
-        :param document: Объект документа.
-        :return: Список токенов (слов и изображений) с позициями, и общее количество слов.
-        """
-        tokens = []
-        current_word_position = 0
-
-        for block in self.iter_block_items(document):
-            if isinstance(block, Paragraph):
-                paragraph = block
-                for run in paragraph.runs:
-                    if self.run_has_image(run):
-                        image_bytes = self.extract_image_from_run(run)
-                        if image_bytes:
-                            tokens.append(
-                                {
-                                    "type": "image",
-                                    "image_bytes": base64.b64encode(image_bytes).decode(
-                                        "utf-8"
-                                    ),
-                                    "position": current_word_position,
-                                }
-                            )
-                    if run.text.strip():
-                        words = run.text.strip().split()
-                        for word in words:
-                            tokens.append(
-                                {
-                                    "type": "word",
-                                    "content": word,
-                                    "position": current_word_position,
-                                }
-                            )
-                            current_word_position += 1
-            elif isinstance(block, Table):
-                pass
-
-        total_words = current_word_position
-        return tokens, total_words
-
-    def _generate_chunks_with_metadata(
-        self,
-        tokens: List[Dict[str, Any]],
-    ) -> Generator[Dict[str, Any], None, None]:
-        """
-        Создает чанки текста с метаданными.
-        :param tokens: Список токенов (слов и изображений) с позициями.
-        :param total_words: Общее количество слов в документе
-        :return: Генератор чанков текста с метаданными.
-        """
-        idx = 0
-        total_tokens = len(tokens)
-        chunk_id = 0
-
-        while idx < total_tokens:
-            chunk_tokens = tokens[idx : idx + self.chunk_size]
-            chunk_text = " ".join(
-                token["content"] for token in chunk_tokens if token["type"] == "word"
-            )
-            chunk_images = [token for token in chunk_tokens if token["type"] == "image"]
-            start_word = chunk_tokens[0]["position"]
-            end_word = chunk_tokens[-1]["position"] + 1
-
-            chunk_id += 1
-            yield {
-                "chunk": chunk_text,
-                "metadata": {
-                    "start_word": start_word,
-                    "end_word": end_word,
-                    "images": chunk_images,
-                },
-            }
-            idx += self.chunk_size - self.overlap
-
-
-class PdfProcessor:
+        try:
+            with open(path, "rb") as file:
+                return file.read()
+        except OSError:
+            pass
+
+    image = page.get_pixmap(dpi=render.dpi).tobytes("png")
+
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write-then-rename, so a concurrent reader never sees a partial file
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, "wb") as file:
+            file.write(image)
+        os.replace(partial, path)
+    return image
+
+
+def read_pdf_pages(
+    path: str,
+    first: int,
+    last: int,
+    render: Optional[PageRenderOptions] = None,
+    document_hash: str = "",
+) -> List[Tuple[str, List[bytes]]]:
+    """
+    Извлекает диапазон страниц PDF; выполняется в отдельном процессе.
+    :param path: Путь к временному файлу с PDF.
+    :param first: Номер первой страницы диапазона, начиная с нуля.
+    :param last: Номер страницы, следующей за последней страницей диапазона.
+    :param render: Настройки рендера страниц.
+    :param document_hash: Хэш содержимого PDF - ключ кэша рендеров.
+    :return: Текст и изображения страниц диапазона по порядку.
+    """
+    with fitz.open(path) as pdf_document:
+        return [
+            read_pdf_page(pdf_document, page_number, render, document_hash)
+            for page_number in range(first, last)
+        ]
+
+
+class PdfProcessor(BaseProcessor):
     """
     Класс для обработки PDF файлов, включая извлечение текста и изображений.
     """
 
-    def __init__(self, chunk_size: int = 100, overlap: int = 25):
+    unit_name = "page_numbers"
+
+    def __init__(
+        self,
+        chunk_size: int = 100,
+        overlap: int = 25,
+        min_image_pixels: int = 0,
+        chunker: Optional[Callable[[Optional[str]], BaseChunker]] = None,
+        executor: Optional[Executor] = None,
+        pages_per_task: int = 8,
+        max_in_flight: int = 4,
+        render: Optional[PageRenderOptions] = None,
+    ):
         """
         Инициализация процессора.
         :param chunk_size: Максимальное количество слов в одном чанке.
         :param overlap: Количество слов, которые перекрываются между чанками.
-        """
-        self.chunk_size = chunk_size
-        self.overlap = overlap
-
-    def process(self, file_bytes: bytes) -> Generator[Dict[str, Any], None, None]:
-        """
-        Обрабатывает PDF файл и возвращает чанки текста с метаданными.
+        :param min_image_pixels: Минимальная площадь изображения в пикселях.
+        :param chunker: Фабрика нарезчика по unit_name.
+        :param executor: Пул процессов для параллельного разбора страниц; без него страницы разбираются последовательно.
+        :param pages_per_task: Количество страниц в одной задаче пула.
+        :param max_in_flight: Максимальное количество задач пула, запущенных наперед.
+        :param render: Настройки рендера страниц в изображения для визуального эмбеддинга;
+            рендер выполняется там же, где разбор, то есть в пуле процессов, если он задан.
+        """
+        super().__init__(chunk_size, overlap, min_image_pixels, chunker)
+        self.executor = executor
+        self.pages_per_task = pages_per_task
+        self.max_in_flight = max_in_flight
+        self.render = render if render and render.mode != "off" else None
+
+    def _extract_tokens(
+        self, file_bytes: bytes, tokens: DocumentTokens
+    ) -> Iterator[None]:
+        """
+        Извлекает текст и изображения из PDF по страницам.
         :param file_bytes: Содержимое PDF файла в байтах.
-        :return: Генератор чанков текста с метаданными.
+        :param tokens: Буфер, в который дописываются слова и изображения с номерами страниц.
         """
-        tokens = self._extract_tokens_with_positions(file_bytes)
-        yield from self._generate_chunks_with_metadata(tokens)
-
-    def _extract_tokens_with_positions(self, file_bytes: bytes) -> List[Dict[str, Any]]:
-        """
-        Извлекает текст и изображения из PDF в порядке их следования, с позициями.
-        :param file_bytes: Содержимое PDF файла в байтах.
-        :return: Список токенов (слов и изображений) с позициями.
-        """
-        tokens = []
-        current_word_position = 0
+        document_hash = ""
+        if self.render and self.render.cache_dir:
+            document_hash = hashlib.sha256(file_bytes).hexdigest()
 
         # Открываем PDF из байтов
-        pdf_document = fitz.open(stream=file_bytes, filetype="pdf")
-
-        for page_number in range(len(pdf_document)):
-            page = pdf_document[page_number]
-            text = page.get_text()
-            if text:
-                words = text.strip().split()
-                for word in words:
-                    tokens.append(
-                        {
-                            "type": "word",
-                            "content": word,
-                            "position": current_word_position,
-                            "page_number": page_number + 1,
-                        }
-                    )
-                    current_word_position += 1
-
-            # Извлечение изображений
-            image_list = page.get_images(full=True)
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
-                try:
-                    base_image = pdf_document.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    tokens.append(
-                        {
-                            "type": "image",
-                            "image_bytes": base64.b64encode(image_bytes).decode(
-                                "utf-8"
-                            ),
-                            "position": current_word_position,
-                            "page_number": page_number + 1,
-                        }
+        with fitz.open(stream=file_bytes, filetype="pdf") as pdf_document:
+            page_count = len(pdf_document)
+            if self.executor is None or page_count <= self.pages_per_task:
+                for page_number in range(page_count):
+                    self._add_page(
+                        tokens,
+                        page_number,
+                        *read_pdf_page(
+                            pdf_document, page_number, self.render, document_hash
+                        ),
                     )
-                except Exception as e:
-                    print(
-                        f"Ошибка при извлечении изображения на странице {page_number + 1}: {e}"
+                    yield
+                return
+
+        yield from self._extract_parallel(file_bytes, page_count, tokens, document_hash)
+
+    def _extract_parallel(
+        self,
+        file_bytes: bytes,
+        page_count: int,
+        tokens: DocumentTokens,
+        document_hash: str = "",
+    ) -> Iterator[None]:
+        """
+        Разбирает диапазоны страниц в пуле процессов и дописывает их в исходном порядке,
+        поэтому позиции слов и номера страниц совпадают с последовательным разбором.
+        """
+        # workers open the document from a temporary file instead of receiving it pickled
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as file:
+            file.write(file_bytes)
+        pending: Deque[Tuple[int, Future]] = deque()
+        try:
+            for first in range(0, page_count, self.pages_per_task):
+                last = min(first + self.pages_per_task, page_count)
+                pending.append(
+                    (
+                        first,
+                        self.executor.submit(
+                            read_pdf_pages,
+                            file.name,
+                            first,
+                            last,
+                            self.render,
+                            document_hash,
+                        ),
                     )
+                )
+                if len(pending) < self.max_in_flight:
+                    continue
+
+                first_page, future = pending.popleft()
+                yield from self._add_pages(tokens, first_page, future.result())
 
-        pdf_document.close()
-        return tokens
+            while pending:
+                first_page, future = pending.popleft()
+                yield from self._add_pages(tokens, first_page, future.result())
+        finally:
+            for _, future in pending:
+                future.cancel()
+            os.unlink(file.name)
 
-    def _generate_chunks_with_metadata(
+    def _add_pages(
         self,
-        tokens: List[Dict[str, Any]],
-    ) -> Generator[Dict[str, Any], None, None]:
-        """
-        Создает чанки текста с метаданными.
-        :param tokens: Список токенов (слов и изображений) с позициями.
-        :return: Генератор чанков текста с метаданными.
-        """
-        idx = 0
-        total_tokens = len(tokens)
-        chunk_id = 0
-
-        while idx < total_tokens:
-            chunk_tokens = tokens[idx : idx + self.chunk_size]
-            chunk_text = " ".join(
-                token["content"] for token in chunk_tokens if token["type"] == "word"
-            )
-            chunk_images = [token for token in chunk_tokens if token["type"] == "image"]
-            start_word = chunk_tokens[0]["position"]
-            end_word = chunk_tokens[-1]["position"] + 1
-
-            chunk_id += 1
-            yield {
-                "chunk": chunk_text,
-                "metadata": {
-                    "start_word": start_word,
-                    "end_word": end_word,
-                    "images": chunk_images,
-                },
-            }
-            idx += self.chunk_size - self.overlap
-
-
-class PptxProcessor:
+        tokens: DocumentTokens,
+        first_page: int,
+        pages: List[Tuple[str, List[bytes]]],
+    ) -> Iterator[None]:
+        for page_number, (text, images) in enumerate(pages, start=first_page):
+            self._add_page(tokens, page_number, text, images)
+            yield
+
+    def _add_page(
+        self, tokens: DocumentTokens, page_number: int, text: str, images: List[bytes]
+    ) -> None:
+        tokens.add_words(text, page_number + 1)
+        for image_bytes in images:
+            self._add_image(tokens, image_bytes, page_number + 1)
+
+
+class PptxProcessor(BaseProcessor):
     """
     Класс для обработки .pptx файлов, включая извлечение текста и изображений.
     """
 
-    def __init__(self, chunk_size: int = 100, overlap: int = 25):
-        """
-        Инициализация процессора.
-        :param chunk_size: Максимальное количество слов в одном чанке.
-        :param overlap: Количество слов, которые перекрываются между чанками.
-        """
-        self.chunk_size = chunk_size
-        self.overlap = overlap
-
-    def process(self, file_bytes: bytes) -> Generator[Dict[str, Any], None, None]:
-        """
-        Обрабатывает .pptx файл и возвращает чанки текста с метаданными.
-        :param file_bytes: Содержимое .pptx файла в байтах.
-        :return: Генератор чанков текста с метаданными.
-        """
-        presentation = self._load_presentation(file_bytes)
-        tokens, total_words = self._extract_tokens_with_positions(presentation)
-        yield from self._generate_chunks_with_metadata(tokens, total_words)
+    unit_name = "slide_numbers"
 
     def _load_presentation(self, file_bytes: bytes) -> Presentation:
         """
@@ -309,16 +481,15 @@ class PptxProcessor:
         """
         return Presentation(BytesIO(file_bytes))
 
-    def _extract_tokens_with_positions(
-        self, presentation: Presentation
-    ) -> (List[Dict[str, Any]], int):
+    def _extract_tokens(
+        self, file_bytes: bytes, tokens: DocumentTokens
+    ) -> Iterator[None]:
         """
-        Извлекает текст и изображения из презентации в порядке их следования, с позициями.
-        :param presentation: Объект презентации.
-        :return: Список токенов (слов и изображений) с позициями, и общее количество слов.
+        Извлекает текст и изображения из презентации по слайдам.
+        :param file_bytes: Содержимое .pptx файла в байтах.
+        :param tokens: Буфер, в который дописываются слова и изображения с номерами слайдов.
         """
-        tokens = []
-        current_word_position = 0
+        presentation = self._load_presentation(file_bytes)
 
         for slide_number, slide in enumerate(presentation.slides, start=1):
             # Извлечение текста
@@ -326,68 +497,10 @@ class PptxProcessor:
                 if shape.has_text_frame:
                     for paragraph in shape.text_frame.paragraphs:
                         for run in paragraph.runs:
-                            words = run.text.strip().split()
-                            for word in words:
-                                tokens.append(
-                                    {
-                                        "type": "word",
-                                        "content": word,
-                                        "position": current_word_position,
-                                        "slide_number": slide_number,
-                                    }
-                                )
-                                current_word_position += 1
+                            tokens.add_words(run.text, slide_number)
 
                 # Извлечение изображений
                 if shape.shape_type == MSO_SHAPE_TYPE.PICTURE:
-                    image = shape.image
-                    image_bytes = image.blob
-                    tokens.append(
-                        {
-                            "type": "image",
-                            "image_bytes": base64.b64encode(image_bytes).decode(
-                                "utf-8"
-                            ),
-                            "position": current_word_position,
-                            "slide_number": slide_number,
-                        }
-                    )
-
-        total_words = current_word_position
-        return tokens, total_words
-
-    def _generate_chunks_with_metadata(
-        self, tokens: List[Dict[str, Any]], total_words: int
-    ) -> Generator[Dict[str, Any], None, None]:
-        """
-        Создает чанки текста с метаданными.
-        :param tokens: Список токенов (слов и изображений) с позициями.
-        :param total_words: Общее количество слов в презентации.
-        :return: Генератор чанков текста с метаданными.
-        """
-        idx = 0
-        total_tokens = len(tokens)
-        chunk_id = 0
-
-        while idx < total_tokens:
-            chunk_tokens = tokens[idx : idx + self.chunk_size]
-            chunk_text = " ".join(
-                token["content"] for token in chunk_tokens if token["type"] == "word"
-            )
-            chunk_images = [token for token in chunk_tokens if token["type"] == "image"]
-            start_word = chunk_tokens[0]["position"]
-            end_word = chunk_tokens[-1]["position"] + 1
-
-            chunk_id += 1
-            yield {
-                "chunk": chunk_text,
-                "metadata": {
-                    "start_word": start_word,
-                    "end_word": end_word,
-                    "images": chunk_images,
-                    "slide_numbers": list(
-                        set(token["slide_number"] for token in chunk_tokens)
-                    ),
-                },
-            }
-            idx += self.chunk_size - self.overlap
+                    image_bytes = shape.image.blob
+                    self._add_image(tokens, image_bytes, slide_number)
+            yield
@@ -1,25 +1,22 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
 import torch
 from loguru import logger
-from colpali_engine.models import ColQwen2, ColQwen2Processor
 
+from configs.Environment import get_environment_variables
+from configs.Executors import image_executor
+from errors.errors import ErrServiceUnavailable
+from ml.cache import EmbeddingCache
 from ml.config import ModelKwargs
-from ml.constants import COLPALI_MODEL_NAME, LLM_PATH
-from ml.llm import LLama3Quantized
-
-device = "cuda" if torch.cuda.is_available() else "cpu"
-
-logger.debug("loading embedder")
-
-embedding_model = ColQwen2.from_pretrained(
-    COLPALI_MODEL_NAME,
-    torch_dtype=torch.bfloat16,
-    device_map=device,  # or "mps" if on Apple Silicon
-).eval()
-
-embedding_processor = ColQwen2Processor.from_pretrained(COLPALI_MODEL_NAME)
+from ml.constants import COLPALI_MODEL_NAME, LLM_PATH, SYSTEM_PROMPT
+from ml.embedding import EmbeddingEngine, quantize_dynamic
+from ml.llm import LLama3Quantized, LLMPool, make_message
 
-llm = LLama3Quantized()
+env = get_environment_variables()
 
+T = TypeVar("T")
 
 kwargs = ModelKwargs(
     temperature=0.7,
@@ -29,4 +26,228 @@ kwargs = ModelKwargs(
     repeat_penalty=1.1,
 )
 
-llm.load_model(kwargs, LLM_PATH)
+
+class LazyModel(Generic[T]):
+    """
+    Модель, которая загружается при первом обращении или заранее в фоне,
+    а не при импорте модуля.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], T]):
+        """
+        Инициализация обертки.
+        :param name: Имя модели для логов и проверки готовности.
+        :param loader: Функция, загружающая модель.
+        """
+        self.name = name
+        self._loader = loader
+        self._value: Optional[T] = None
+        self._error: Optional[Exception] = None
+        self._loading = False
+        self._lock = threading.Lock()
+        self._warm_lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self._value is not None:
+            return "ready"
+        if self._loading:
+            return "loading"
+        if self._error is not None:
+            return "failed"
+        return "idle"
+
+    def peek(self) -> Optional[T]:
+        """
+        Возвращает модель, только если она уже загружена.
+        """
+        return self._value
+
+    def get(self) -> T:
+        """
+        Возвращает модель, загружая ее при необходимости; конкурентные вызовы ждут одну загрузку.
+        """
+        if self._value is not None:
+            return self._value
+        with self._lock:
+            if self._value is None:
+                self._load()
+        return self._value
+
+    async def aget(self) -> T:
+        """
+        Вариант get для event loop: запрос не ждет загрузку, которая длится минуты,
+        а сразу получает ErrServiceUnavailable, пока модель загружается в фоне.
+        """
+        if self._value is None:
+            self.warm()
+            raise ErrServiceUnavailable(f"{self.name} is not ready")
+        return self._value
+
+    def warm(self) -> None:
+        """
+        Запускает загрузку модели в фоновом потоке, если она еще не идет.
+        """
+        with self._warm_lock:
+            if self._value is not None or self._loading:
+                return
+            self._loading = True
+        threading.Thread(
+            target=self._warm, name=f"warm-{self.name}", daemon=True
+        ).start()
+
+    def _warm(self) -> None:
+        try:
+            self.get()
+        except Exception:
+            pass
+
+    def _load(self) -> None:
+        logger.info(f"{self.name} - loading")
+        self._loading = True
+        self._error = None
+        started = time.perf_counter()
+        try:
+            self._value = self._loader()
+        except Exception as e:
+            logger.error(f"{self.name} - loading failed: {e}")
+            self._error = e
+            raise
+        finally:
+            self._loading = False
+        self.load_seconds = time.perf_counter() - started
+        logger.info(f"{self.name} - loaded in {self.load_seconds:.1f}s")
+
+
+def load_colqwen(
+    device: str, dtype: torch.dtype, quantization: str = "none"
+) -> Tuple[Any, Any]:
+    """
+    Загружает ColQwen2 и его процессор.
+    :param device: Устройство, на котором выполняется модель.
+    :param dtype: Тип весов модели.
+    :param quantization: "int8" - динамическая int8-квантизация линейных слоев, только на CPU.
+    :return: Модель и процессор.
+    """
+    # transformers is imported on first load only, not by every importer of this module
+    from colpali_engine.models import ColQwen2, ColQwen2Processor
+
+    if quantization == "int8" and device != "cpu":
+        raise ValueError("int8-квантизация поддерживается только на CPU.")
+
+    model = ColQwen2.from_pretrained(
+        COLPALI_MODEL_NAME,
+        torch_dtype=torch.float32 if quantization == "int8" else dtype,
+        device_map=device,  # or "mps" if on Apple Silicon
+    ).eval()
+    if quantization == "int8":
+        model = quantize_dynamic(model)
+
+    return model, ColQwen2Processor.from_pretrained(COLPALI_MODEL_NAME)
+
+
+def embedding_device() -> Tuple[str, torch.dtype]:
+    device = env.EMBEDDING_DEVICE or ("cuda" if torch.cuda.is_available() else "cpu")
+    # CPUs without native bf16 emulate it and end up slower than float32
+    dtype = (
+        torch.bfloat16 if device != "cpu" or env.EMBEDDING_CPU_BF16 else torch.float32
+    )
+    return device, dtype
+
+
+def load_embedding_engine() -> EmbeddingEngine:
+    if env.EMBEDDING_THREADS > 0:
+        torch.set_num_threads(env.EMBEDDING_THREADS)
+
+    device, dtype = embedding_device()
+    model, processor = load_colqwen(device, dtype, env.EMBEDDING_QUANTIZATION)
+    # quantized embeddings differ slightly, so they never mix with full precision ones
+    namespace = COLPALI_MODEL_NAME
+    if env.EMBEDDING_QUANTIZATION != "none":
+        namespace = f"{namespace}-{env.EMBEDDING_QUANTIZATION}"
+
+    return EmbeddingEngine(
+        model,
+        processor,
+        device,
+        max_batch_size=env.EMBEDDING_MAX_BATCH_SIZE,
+        max_wait_ms=env.EMBEDDING_MAX_WAIT_MS,
+        image_cache=EmbeddingCache(
+            env.EMBEDDING_CACHE_SIZE,
+            env.EMBEDDING_CACHE_DIR or None,
+            # image embeddings depend on the pixel budget they were computed with
+            namespace=f"{namespace}-{env.IMAGE_MAX_PIXELS}px",
+        ),
+        perceptual_hash=env.IMAGE_PERCEPTUAL_HASH,
+        query_cache=EmbeddingCache(
+            env.QUERY_CACHE_SIZE,
+            env.EMBEDDING_CACHE_DIR or None,
+            namespace=f"{namespace}-queries",
+        ),
+        pin_memory=device == "cuda",
+        max_image_pixels=env.IMAGE_MAX_PIXELS,
+        preprocess_executor=image_executor,
+    )
+
+
+def load_tokenizer() -> Any:
+    # the embedding processor already holds it when the model is loaded in process
+    engine = embedding_model.peek()
+    if engine is not None:
+        return engine.processor.tokenizer
+
+    from colpali_engine.models import ColQwen2Processor
+
+    return ColQwen2Processor.from_pretrained(COLPALI_MODEL_NAME).tokenizer
+
+
+def load_llm() -> LLama3Quantized:
+    model = LLama3Quantized()
+    model.load_model(kwargs, LLM_PATH)
+    model.cache_prefix([make_message("system", SYSTEM_PROMPT)])
+    return model
+
+
+def load_llm_pool() -> LLMPool:
+    return LLMPool(
+        [load_llm() for _ in range(env.LLM_POOL_SIZE)],
+        max_waiting=env.LLM_MAX_WAITING,
+        acquire_timeout=env.LLM_ACQUIRE_TIMEOUT,
+    )
+
+
+embedding_model: LazyModel[EmbeddingEngine] = LazyModel(
+    "embedding", load_embedding_engine
+)
+llm_model: LazyModel[LLMPool] = LazyModel("llm", load_llm_pool)
+# only used to measure chunks, so API processes load it without the model
+tokenizer_model: LazyModel[Any] = LazyModel("tokenizer", load_tokenizer)
+
+# models each APP_ROLE serves
+ROLE_MODELS: Dict[str, List[LazyModel]] = {
+    "all": [embedding_model, llm_model],
+    "indexing": [embedding_model],
+    "search": [embedding_model, llm_model],
+    "embedding": [embedding_model],
+    "llm": [llm_model],
+}
+
+# models that API processes reach over HTTP instead of loading them
+WORKER_URLS: Dict[str, str] = {
+    "embedding": env.EMBEDDING_WORKER_URL,
+    "llm": env.LLM_WORKER_URL,
+}
+
+
+def local_models(role: str) -> List[LazyModel]:
+    """
+    Модели роли, которые загружаются в этом процессе.
+    :param role: Значение APP_ROLE.
+    :return: Модели роли без тех, что обслуживаются отдельным воркером.
+    """
+    return [
+        model
+        for model in ROLE_MODELS[role]
+        if model.name == role or not WORKER_URLS[model.name]
+    ]
@@ -1,8 +1,12 @@
+import queue
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import List, Dict, Optional
-from llama_cpp import Llama
+from typing import Any, List, Dict, Optional, Iterator
+from llama_cpp import Llama, LlamaState
 
-from config import ModelKwargs
+from errors.errors import ErrServiceUnavailable
+from ml.config import ModelKwargs
 
 
 class BaseLlama3Model(ABC):
@@ -10,27 +14,45 @@ class BaseLlama3Model(ABC):
     def load_model(self, kwargs: ModelKwargs, model_path: str) -> None: ...
 
     @abstractmethod
-    def inference(self, kwargs: Optional[ModelKwargs] = None) -> str: ...
+    def inference(
+        self, messages: List[Dict[str, str]], kwargs: Optional[ModelKwargs] = None
+    ) -> str: ...
 
     @abstractmethod
-    def add_message(self, role: str, content: str) -> None: ...
+    def inference_stream(
+        self, messages: List[Dict[str, str]], kwargs: Optional[ModelKwargs] = None
+    ) -> Iterator[str]: ...
 
-    @abstractmethod
-    def clean_chat(self) -> None: ...
+    def metrics(self) -> Dict[str, Any]:
+        return {}
 
-    @abstractmethod
-    def print_chat(self) -> None: ...
 
-    @abstractmethod
-    def get_chat(self) -> List[Dict[str, str]]: ...
+def make_message(role: str, content: str) -> Dict[str, str]:
+    if not role or not content:
+        raise ValueError("Роль и содержание не могут быть пустыми.")
+    return {"role": role, "content": content}
 
 
 class LLama3Quantized(BaseLlama3Model):
+    """
+    Llama 3 в GGUF. Промпт собирается по шаблону Llama 3 вручную, чтобы токены
+    статического префикса (системного промпта) совпадали между запросами и его
+    KV-состояние можно было сохранить один раз и восстанавливать перед каждым запросом.
+    """
+
+    _HEADER = "<|start_header_id|>{}<|end_header_id|>\n\n"
+    _EOT = "<|eot_id|>"
+
     def __init__(self) -> None:
         super().__init__()
         self._llm: Optional[Llama] = None
-        self._chat: List[Dict[str, str]] = []
         self._kwargs: ModelKwargs = ModelKwargs()
+        self._prefix_tokens: List[int] = []
+        self._prefix_state: Optional[LlamaState] = None
+        self._prefix_eval_seconds = 0.0
+        self._prefix_hits = 0
+        self._prefix_misses = 0
+        self._prefix_restores = 0
 
     def load_model(self, kwargs: ModelKwargs, model_path: str) -> None:
         if not model_path:
@@ -44,36 +66,201 @@ class LLama3Quantized(BaseLlama3Model):
         )
         self._kwargs = kwargs
 
+    def cache_prefix(self, messages: List[Dict[str, str]]) -> None:
+        """
+        Вычисляет и сохраняет KV-состояние для статических сообщений в начале промпта.
+        :param messages: Сообщения, с которых начинается каждый запрос.
+        """
+        self._check_model_loaded()
+        self._check_messages(messages)
+        tokens = [self._llm.token_bos()]
+        for message in messages:
+            tokens += self._tokenize_message(message)
+
+        started = time.perf_counter()
+        self._llm.reset()
+        self._llm.eval(tokens)
+        self._prefix_eval_seconds = time.perf_counter() - started
+        self._prefix_state = self._llm.save_state()
+        self._prefix_tokens = tokens
+
     def _check_model_loaded(self) -> None:
         if not self._llm:
             raise RuntimeError(
                 "Модель не загружена. Пожалуйста, загрузите модель перед выполнением вывода."
             )
 
-    def inference(self, kwargs: Optional[ModelKwargs] = None) -> str:
-        self._check_model_loaded()
-        if not kwargs:
-            kwargs = self._kwargs
-        if not self._chat:
+    @staticmethod
+    def _check_messages(messages: List[Dict[str, str]]) -> None:
+        if not messages:
             raise RuntimeError(
                 "Чат пуст. Пожалуйста, добавьте сообщения в чат перед выполнением вывода."
             )
-        return self._llm.create_chat_completion(
-            self._chat,
+
+    def _tokenize_message(self, message: Dict[str, str]) -> List[int]:
+        # special tokens are allowed in the template only, never in the content
+        return (
+            self._llm.tokenize(
+                self._HEADER.format(message["role"]).encode(),
+                add_bos=False,
+                special=True,
+            )
+            + self._llm.tokenize(
+                message["content"].encode(), add_bos=False, special=False
+            )
+            + self._llm.tokenize(self._EOT.encode(), add_bos=False, special=True)
+        )
+
+    def _prompt(self, messages: List[Dict[str, str]]) -> List[int]:
+        """
+        Токенизирует сообщения и готовит KV-кэш: если промпт начинается с
+        сохраненного префикса, а кэш модели его уже не содержит, префикс восстанавливается.
+        Дальше llama.cpp сам переиспользует совпадающий префикс и считает только остаток.
+        """
+        tokens = [self._llm.token_bos()]
+        for message in messages:
+            tokens += self._tokenize_message(message)
+        tokens += self._llm.tokenize(
+            self._HEADER.format("assistant").encode(), add_bos=False, special=True
+        )
+
+        size = len(self._prefix_tokens)
+        if not size or tokens[:size] != self._prefix_tokens:
+            self._prefix_misses += 1
+            return tokens
+
+        self._prefix_hits += 1
+        cached = self._llm.input_ids[: self._llm.n_tokens].tolist()
+        if cached[:size] != self._prefix_tokens:
+            self._llm.load_state(self._prefix_state)
+            self._prefix_restores += 1
+        return tokens
+
+    def _completion(
+        self,
+        messages: List[Dict[str, str]],
+        kwargs: Optional[ModelKwargs],
+        stream: bool,
+    ):
+        self._check_model_loaded()
+        if not kwargs:
+            kwargs = self._kwargs
+        self._check_messages(messages)
+        return self._llm.create_completion(
+            self._prompt(messages),
+            max_tokens=None,
             temperature=kwargs.temperature,
             top_k=kwargs.top_k,
             top_p=kwargs.top_p,
             repeat_penalty=kwargs.repeat_penalty,
-            stream=False,
-        )["choices"][0]["message"]["content"]
+            stop=[self._EOT],
+            stream=stream,
+        )
+
+    def inference(
+        self, messages: List[Dict[str, str]], kwargs: Optional[ModelKwargs] = None
+    ) -> str:
+        return self._completion(messages, kwargs, stream=False)["choices"][0]["text"]
+
+    def inference_stream(
+        self, messages: List[Dict[str, str]], kwargs: Optional[ModelKwargs] = None
+    ) -> Iterator[str]:
+        for chunk in self._completion(messages, kwargs, stream=True):
+            token = chunk["choices"][0]["text"]
+            if token:
+                yield token
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "prefix_tokens": len(self._prefix_tokens),
+            "prefix_hits": self._prefix_hits,
+            "prefix_misses": self._prefix_misses,
+            "prefix_restores": self._prefix_restores,
+            "prefill_tokens_saved": self._prefix_hits * len(self._prefix_tokens),
+            "prefill_seconds_saved": round(
+                self._prefix_hits * self._prefix_eval_seconds, 3
+            ),
+        }
+
+
+class LLMPool:
+    """
+    Ограниченный пул загруженных моделей. Запрос занимает модель на время генерации;
+    при переполнении очереди ожидания или по таймауту возвращается 503.
+    """
+
+    def __init__(
+        self,
+        models: List[BaseLlama3Model],
+        max_waiting: int = 8,
+        acquire_timeout: float = 30,
+    ):
+        """
+        Инициализация пула.
+        :param models: Загруженные экземпляры модели; их количество задает параллелизм.
+        :param max_waiting: Максимальное количество запросов, ожидающих свободную модель.
+        :param acquire_timeout: Максимальное время ожидания свободной модели в секундах.
+        """
+        if not models:
+            raise ValueError("Пул моделей не может быть пустым.")
+        self.size = len(models)
+        self._models = list(models)
+        self.max_waiting = max_waiting
+        self.acquire_timeout = acquire_timeout
+        self._idle: "queue.Queue[BaseLlama3Model]" = queue.Queue()
+        for model in models:
+            self._idle.put(model)
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def inference(
+        self, messages: List[Dict[str, str]], kwargs: Optional[ModelKwargs] = None
+    ) -> str:
+        model = self._acquire()
+        try:
+            return model.inference(messages, kwargs)
+        finally:
+            self._idle.put(model)
+
+    def inference_stream(
+        self, messages: List[Dict[str, str]], kwargs: Optional[ModelKwargs] = None
+    ) -> Iterator[str]:
+        stream = self._stream(messages, kwargs)
+        # take the model now so that overload fails before the response starts
+        next(stream)
+        return stream
 
-    def add_message(self, role: str, content: str) -> None:
-        if not role or not content:
-            raise ValueError("Роль и содержание не могут быть пустыми.")
-        self._chat.append({"role": role, "content": content})
+    def _stream(
+        self, messages: List[Dict[str, str]], kwargs: Optional[ModelKwargs]
+    ) -> Iterator[str]:
+        model = self._acquire()
+        try:
+            yield ""
+            yield from model.inference_stream(messages, kwargs)
+        finally:
+            self._idle.put(model)
 
-    def clean_chat(self) -> None:
-        self._chat = []
+    def _acquire(self) -> BaseLlama3Model:
+        with self._lock:
+            if self._waiting >= self.max_waiting:
+                raise ErrServiceUnavailable("LLM queue is full")
+            self._waiting += 1
+        try:
+            return self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise ErrServiceUnavailable("LLM is busy")
+        finally:
+            with self._lock:
+                self._waiting -= 1
 
-    def get_chat(self) -> List[Dict[str, str]]:
-        return self._chat
+    def metrics(self) -> Dict[str, Any]:
+        totals: Dict[str, Any] = {}
+        for model_metrics in (model.metrics() for model in self._models):
+            for key, value in model_metrics.items():
+                totals[key] = totals.get(key, 0) + value
+        return {
+            "size": self.size,
+            "busy": self.size - self._idle.qsize(),
+            "waiting": self._waiting,
+            **totals,
+        }
@@ -0,0 +1,41 @@
+import enum
+import uuid
+
+from sqlalchemy import Column, DateTime, Enum, Integer, String, Text, func
+from sqlalchemy.dialects.postgresql import UUID
+
+from models.BaseModel import EntityMeta
+
+
+class JobStatus(enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class IndexingJob(EntityMeta):
+    __tablename__ = "indexing_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    title = Column(String, nullable=False)
+    kind = Column(String(16), nullable=False)
+    minio_path = Column(String, nullable=True)
+    status = Column(
+        Enum(JobStatus, name="job_status"),
+        nullable=False,
+        default=JobStatus.PENDING,
+        index=True,
+    )
+    chunks_done = Column(Integer, nullable=False, default=0)
+    # unknown until the parser has seen the whole document
+    chunks_total = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    # the process running the job keeps extending its lease; an expired lease
+    # means the process is gone and any other one may take the job over
+    owner = Column(String(32), nullable=True)
+    lease_until = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
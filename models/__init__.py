@@ -1 +1 @@
-
+from models.IndexingJob import IndexingJob, JobStatus
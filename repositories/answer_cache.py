@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+from loguru import logger
+from qdrant_client.models import ScoredPoint
+
+from configs.Environment import get_environment_variables
+from ml.embedding import query_similarity, question_tokens
+
+env = get_environment_variables()
+
+# answers kept per set of retrieved points, for different questions
+ENTRIES_PER_KEY = 8
+
+
+def normalize_question(text: str) -> str:
+    # case, spacing and trailing punctuation do not change what is asked
+    return re.sub(r"\s+", " ", text).strip(" .,;:!?…").casefold()
+
+
+class BaseAnswerCache(ABC):
+    """
+    Storage for cached answers: every key maps to a short list of entries.
+    """
+
+    hits = 0
+    misses = 0
+
+    @abstractmethod
+    async def get(self, key: str) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    async def put(self, key: str, entries: List[Dict[str, Any]]):
+        pass
+
+
+class MemoryAnswerCache(BaseAnswerCache):
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._items: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+    async def get(self, key: str) -> List[Dict[str, Any]]:
+        entries = self._items.get(key)
+        if entries is None:
+            return []
+        self._items.move_to_end(key)
+        return entries
+
+    async def put(self, key: str, entries: List[Dict[str, Any]]):
+        self._items[key] = entries
+        self._items.move_to_end(key)
+        while len(self._items) > self._max_size:
+            self._items.popitem(last=False)
+
+
+class DiskAnswerCache(BaseAnswerCache):
+    def __init__(self, directory: str, ttl: float):
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._prune(ttl)
+
+    def _prune(self, ttl: float):
+        # entries are only filtered on read, files nobody asks for again go here
+        deadline = time.time() - ttl
+        for entry in os.scandir(self._directory):
+            try:
+                if entry.stat().st_mtime < deadline:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    async def get(self, key: str) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._read, self._path(key))
+
+    async def put(self, key: str, entries: List[Dict[str, Any]]):
+        await asyncio.to_thread(self._write, self._path(key), entries)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, f"{key}.json")
+
+    @staticmethod
+    def _read(path: str) -> List[Dict[str, Any]]:
+        try:
+            with open(path, encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return []
+
+    @staticmethod
+    def _write(path: str, entries: List[Dict[str, Any]]):
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, "w", encoding="utf-8") as file:
+            json.dump(entries, file, ensure_ascii=False)
+        os.replace(partial, path)
+
+
+def make_answer_cache() -> Optional[BaseAnswerCache]:
+    if env.ANSWER_CACHE_BACKEND == "memory":
+        return MemoryAnswerCache(env.ANSWER_CACHE_SIZE)
+    if env.ANSWER_CACHE_BACKEND == "disk":
+        return DiskAnswerCache(env.ANSWER_CACHE_DIR, env.ANSWER_CACHE_TTL)
+    return None
+
+
+answer_cache = make_answer_cache()
+
+
+class AnswerCacheRepository:
+    """
+    Answers are looked up by the exact set of retrieved points and reused for
+    the same question: its normalized text, or the hash of a query image.
+    A text query with different wording also matches when the MaxSim between
+    its question tokens and the cached ones reaches the threshold. The query
+    prefix and augmentation tokens are left out of that comparison, since they
+    are the same in every query and make short questions look alike.
+
+    The document hash of every retrieved point is part of the key, so once a
+    referenced document is re-indexed its old answers are never matched again
+    and simply expire.
+    """
+
+    def __init__(self):
+        self._cache = answer_cache
+        self.ttl = env.ANSWER_CACHE_TTL
+        self.threshold = env.ANSWER_CACHE_THRESHOLD
+
+    async def get(
+        self,
+        kind: str,
+        documents: List[ScoredPoint],
+        question: str,
+        embedding: Optional[torch.Tensor] = None,
+    ) -> Optional[str]:
+        key = self._key(kind, documents)
+        if key is None:
+            return None
+
+        now = time.time()
+        entries = [
+            entry
+            for entry in await self._cache.get(key)
+            if now - entry["created"] <= self.ttl
+        ]
+        answer = self._exact(entries, question)
+        if answer is None and embedding is not None:
+            answer = self._similar(entries, embedding)
+        if answer is None:
+            self._cache.misses += 1
+            return None
+
+        logger.debug("AnswerCache - Repository - hit")
+        self._cache.hits += 1
+        return answer
+
+    async def put(
+        self,
+        kind: str,
+        documents: List[ScoredPoint],
+        question: str,
+        answer: str,
+        embedding: Optional[torch.Tensor] = None,
+    ):
+        key = self._key(kind, documents)
+        if key is None:
+            return
+
+        now = time.time()
+        entries = [
+            entry
+            for entry in await self._cache.get(key)
+            if now - entry["created"] <= self.ttl and entry.get("question") != question
+        ]
+        entry = {"question": question, "answer": answer, "created": now}
+        if embedding is not None:
+            entry["tokens"] = question_tokens(embedding).tolist()
+        entries.append(entry)
+        await self._cache.put(key, entries[-ENTRIES_PER_KEY:])
+
+    @staticmethod
+    def _exact(entries: List[Dict[str, Any]], question: str) -> Optional[str]:
+        for entry in entries:
+            if entry.get("question") == question:
+                return entry["answer"]
+        return None
+
+    def _similar(
+        self, entries: List[Dict[str, Any]], embedding: torch.Tensor
+    ) -> Optional[str]:
+        tokens = np.asarray(question_tokens(embedding).tolist(), dtype=np.float32)
+        best, answer = self.threshold, None
+        for entry in entries:
+            if "tokens" not in entry:
+                continue
+            cached = np.asarray(entry["tokens"], dtype=np.float32)
+            similarity = query_similarity(tokens, cached)
+            if similarity >= best:
+                best, answer = similarity, entry["answer"]
+        return answer
+
+    def metrics(self) -> Dict[str, Any]:
+        if self._cache is None:
+            return {}
+        total = self._cache.hits + self._cache.misses
+        return {
+            "hits": self._cache.hits,
+            "misses": self._cache.misses,
+            "hit_rate": round(self._cache.hits / total, 3) if total else 0.0,
+        }
+
+    def _key(self, kind: str, documents: List[ScoredPoint]) -> Optional[str]:
+        if self._cache is None or not documents:
+            return None
+
+        parts = []
+        for document in documents:
+            document_hash = (document.payload or {}).get("document_hash")
+            # the document is being indexed right now, its context is not stable yet
+            if not document_hash:
+                return None
+            parts.append(f"{document.id}:{document_hash}")
+
+        digest = hashlib.sha256("\n".join(sorted(parts)).encode()).hexdigest()
+        return f"{kind}-{digest}"
@@ -1,26 +1,87 @@
-import io
+import asyncio
+from typing import Any, Dict, List, Optional
 
 import torch
-from PIL import Image
 
-from ml.lifespan import device, embedding_model, embedding_processor
+from configs.Executors import embedding_executor
+from errors.errors import ErrBadRequest
+from ml.embedding import load_embeddings
+from ml.lifespan import embedding_model
+from repositories.workers import embedding_worker
+from utils.utils import run_in
 
 
 class EmbeddingRepository:
     def __init__(self):
-        self.device = device
+        self._model = embedding_model
+        # with a worker URL the model lives in the embedding worker process
+        self._worker = embedding_worker
 
-    def extract_text_embeddings(self, text: str) -> torch.Tensor:
-        with torch.inference_mode():
-            processed_text = embedding_processor.process_queries(text).to(self.device)
-            text_embedding = embedding_model(processed_text)
+    async def extract_text_embeddings(self, text: str) -> torch.Tensor:
+        if self._worker:
+            response = await self._worker.post(
+                "/api/v1/workers/embedding/text", json={"text": text}
+            )
+            return load_embeddings(response.content)[0]
 
-        return text_embedding
+        engine = await self._model.aget()
+        return await asyncio.wrap_future(engine.submit_text(text))
 
-    def extract_image_embeddings(self, image_bytes: bytes) -> torch.Tensor:
-        with torch.inference_mode():
-            image = Image.open(io.BytesIO(image_bytes))
-            processed_image = embedding_processor.process_queries(image).to(self.device)
-            image_embedding = embedding_model(processed_image)
+    async def extract_image_embeddings(self, image_bytes: bytes) -> torch.Tensor:
+        if self._worker:
+            response = await self._worker.post(
+                "/api/v1/workers/embedding/image", content=image_bytes
+            )
+            embedding = load_embeddings(response.content)[0]
+        else:
+            engine = await self._model.aget()
+            embedding = await asyncio.wrap_future(engine.submit_image(image_bytes))
 
-        return image_embedding
+        if embedding is None:
+            raise ErrBadRequest("Image cannot be decoded")
+        return embedding
+
+    async def extract_text_embeddings_batch(
+        self, texts: List[str], lengths: Optional[List[Optional[int]]] = None
+    ) -> List[torch.Tensor]:
+        if self._worker:
+            response = await self._worker.post(
+                "/api/v1/workers/embedding/texts",
+                json={"texts": texts, "lengths": lengths},
+            )
+            return load_embeddings(response.content)
+
+        engine = await self._model.aget()
+        return await run_in(embedding_executor, engine.embed_texts, texts, lengths)
+
+    async def extract_image_embeddings_batch(
+        self, images: List[bytes]
+    ) -> List[Optional[torch.Tensor]]:
+        if not images:
+            return []
+        if self._worker:
+            response = await self._worker.post(
+                "/api/v1/workers/embedding/images",
+                files=[("images", (str(i), image)) for i, image in enumerate(images)],
+            )
+            return load_embeddings(response.content)
+
+        engine = await self._model.aget()
+        return await run_in(embedding_executor, engine.embed_images, images)
+
+    async def metrics(self) -> Dict[str, Any]:
+        if self._worker:
+            metrics = await self._worker.get_json("/api/v1/workers/embedding/metrics")
+            return metrics or {"state": "unreachable"}
+
+        engine = self._model.peek()
+        if engine is None:
+            return {"state": self._model.state}
+
+        image_cache = engine.image_cache
+        query_cache = engine.query_cache
+        return {
+            "state": self._model.state,
+            "image_cache": image_cache.metrics() if image_cache else {},
+            "query_cache": query_cache.metrics() if query_cache else {},
+        }
@@ -1,11 +1,24 @@
+import asyncio
 from abc import ABC, abstractmethod
 
-from typing import List
+from typing import Any, AsyncIterator, Dict, Iterator, List
+from loguru import logger
 from notion_client import Client
 from atlassian import confluence
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from configs.Environment import get_environment_variables
 from schemas.integrations import PageResponse, ResponseType
 
+env = get_environment_variables()
+
+
+def cql_escape(value: str) -> str:
+    # a label is a CQL string literal: a quote must not end it early
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
 
 class BaseIntegrator(ABC):
     """
@@ -32,26 +45,121 @@ class BaseIntegrator(ABC):
 
 
 class ConfluenceIntegration(BaseIntegrator):
-    def __init__(self, url: str, username: str, password: str):
+    def __init__(
+        self,
+        url: str,
+        username: str,
+        password: str,
+        concurrency: int = env.CONFLUENCE_CONCURRENCY,
+    ):
+        self._concurrency = concurrency
         self._conn = confluence.Confluence(
-            url=url, username=username, password=password
+            url=url,
+            username=username,
+            password=password,
+            session=self._session(url, concurrency),
         )
 
-    def fetch_data(self, page_id: str) -> List[PageResponse]:
-        pages = self._conn.get_all_pages_by_label(label=page_id, start=0, limit=100)
-
-        pdfs = []
-
-        for page in pages:
-            response = self._conn.get_page_as_pdf(page["id"])
+    @staticmethod
+    def _session(url: str, concurrency: int) -> Session:
+        # one keep-alive connection per concurrent download; rate limits and
+        # overloads are retried with exponential backoff, honouring Retry-After
+        retries = Retry(
+            total=None,
+            connect=3,
+            read=2,
+            status=env.CONFLUENCE_MAX_RETRIES,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=None,
+            backoff_factor=1,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        session = Session()
+        session.mount(
+            url,
+            HTTPAdapter(
+                pool_connections=1, pool_maxsize=concurrency, max_retries=retries
+            ),
+        )
+        return session
 
-            pdfs.append(
-                PageResponse(
-                    title=page["title"], content=response, type=ResponseType.PDF
-                )
-            )
+    def fetch_data(self, page_id: str) -> List[PageResponse]:
+        return [
+            self._download(page)
+            for batch in self._list_batches(page_id)
+            for page in batch
+        ]
+
+    def _list_batches(self, label: str) -> Iterator[List[Dict[str, Any]]]:
+        # newer servers page search results with a cursor and ignore `start`,
+        # so the listing follows _links.next until the server stops sending it
+        path = "rest/api/content/search"
+        params = {
+            "cql": f'type=page AND label="{cql_escape(label)}"',
+            "limit": env.CONFLUENCE_PAGE_LIMIT,
+        }
+        while path:
+            response = self._conn.get(path, params=params)
+            yield response.get("results", [])
+            # the next link is relative to the API root and carries its own query
+            path, params = response.get("_links", {}).get("next"), None
+
+    def _download(self, page: Dict[str, Any]) -> PageResponse:
+        return PageResponse(
+            id=page["id"],
+            title=page["title"],
+            content=self._conn.get_page_as_pdf(page["id"]),
+            type=ResponseType.PDF,
+        )
 
-        return pdfs
+    async def iter_pages(self, label: str) -> AsyncIterator[PageResponse]:
+        """
+        Yields the pages of a label as PDFs as soon as each one is downloaded.
+        At most `concurrency` downloads run at once and as many finished pages
+        wait for the consumer, so memory does not grow with the label size.
+        """
+        queue: asyncio.Queue = asyncio.Queue(self._concurrency)
+        producer = asyncio.create_task(self._download_all(label, queue))
+        try:
+            while (page := await queue.get()) is not None:
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    async def _download_all(self, label: str, queue: asyncio.Queue):
+        slots = asyncio.Semaphore(self._concurrency)
+        downloads: set[asyncio.Task] = set()
+
+        async def download(page: Dict[str, Any]):
+            try:
+                await queue.put(await asyncio.to_thread(self._download, page))
+            except Exception as e:
+                # one broken page must not stop a sync of thousands
+                logger.error(f"Confluence - Integration - page {page['id']}: {e}")
+            finally:
+                slots.release()
+
+        batches = self._list_batches(label)
+        try:
+            # the next listing batch is requested while the previous one downloads
+            while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+                for page in batch:
+                    await slots.acquire()
+                    task = asyncio.create_task(download(page))
+                    downloads.add(task)
+                    task.add_done_callback(downloads.discard)
+            await asyncio.gather(*downloads)
+        except Exception as e:
+            await queue.put(e)
+            return
+        finally:
+            for task in downloads:
+                task.cancel()
+        await queue.put(None)
 
     def source(self) -> str:
         return "Confluence"
@@ -0,0 +1,136 @@
+import uuid
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from fastapi import Depends
+from loguru import logger
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from configs.Database import engine, get_db_connection
+from models.IndexingJob import IndexingJob, JobStatus
+from repositories.mixins.crud import CRUDRepositoryMixin
+
+# pending jobs and abandoned running ones; a postponed pending job carries a
+# lease too, so it is not taken before its retry time
+CLAIMABLE = IndexingJob.status.in_([JobStatus.PENDING, JobStatus.RUNNING]) & or_(
+    IndexingJob.lease_until.is_(None), IndexingJob.lease_until < func.now()
+)
+
+
+@asynccontextmanager
+async def document_lock(document: str) -> AsyncIterator[bool]:
+    """
+    Postgres advisory lock of a document for the whole run of its job, so two
+    revisions of one document are never indexed at the same time. Yields False
+    if another process holds it. The lock lives on its own connection: a
+    session returns its connection to the pool after every commit.
+    """
+    key = func.hashtextextended(document, 0)
+    async with engine.connect() as connection:
+        locked = await connection.scalar(select(func.pg_try_advisory_lock(key)))
+        try:
+            yield locked
+        finally:
+            if locked:
+                try:
+                    await connection.scalar(select(func.pg_advisory_unlock(key)))
+                except Exception as e:
+                    # never return a connection that may still hold the lock
+                    logger.error(f"IndexingJob - Repository - unlock: {e}")
+                    await connection.invalidate()
+
+
+class IndexingJobRepository(CRUDRepositoryMixin):
+    def __init__(self, db: AsyncSession = Depends(get_db_connection)):
+        super().__init__(IndexingJob, db)
+
+    async def update(self, id: uuid.UUID, **fields: Any) -> IndexingJob:
+        logger.debug("IndexingJob - Repository - update")
+        instance = await self.get(id)
+        for k, v in fields.items():
+            setattr(instance, k, v)
+        await self._db.commit()
+        await self._db.refresh(instance)
+        return instance
+
+    async def list_claimable(self) -> Sequence[IndexingJob]:
+        logger.debug("IndexingJob - Repository - list_claimable")
+        query = select(IndexingJob).where(CLAIMABLE).order_by(IndexingJob.created_at)
+        result = await self._db.execute(query)
+        return result.scalars().all()
+
+    async def claim(
+        self, id: uuid.UUID, owner: str, lease: float
+    ) -> Optional[IndexingJob]:
+        """
+        Atomically takes a pending job or one whose lease expired; None if
+        another process holds it or it is finished.
+        """
+        logger.debug("IndexingJob - Repository - claim")
+        query = (
+            update(IndexingJob)
+            .where(IndexingJob.id == id, CLAIMABLE)
+            .values(
+                status=JobStatus.RUNNING,
+                owner=owner,
+                lease_until=func.now() + timedelta(seconds=lease),
+                chunks_done=0,
+                chunks_total=None,
+                error=None,
+            )
+            .returning(IndexingJob)
+            .execution_options(synchronize_session=False)
+        )
+        job = (await self._db.execute(query)).scalar_one_or_none()
+        await self._db.commit()
+        return job
+
+    async def renew(
+        self, id: uuid.UUID, owner: str, lease: float, **fields: Any
+    ) -> bool:
+        """
+        Extends the lease and updates fields while the job is still ours.
+        """
+        return await self._owned_update(
+            id, owner, lease_until=func.now() + timedelta(seconds=lease), **fields
+        )
+
+    async def release(self, id: uuid.UUID, owner: str, **fields: Any) -> bool:
+        """
+        Sets the final fields of a run; a job taken over by another process
+        is left alone.
+        """
+        return await self._owned_update(
+            id, owner, owner=None, lease_until=None, **fields
+        )
+
+    async def postpone(self, id: uuid.UUID, owner: str, delay: float) -> bool:
+        """
+        Returns the job to pending; no process takes it before the delay passes.
+        """
+        return await self._owned_update(
+            id,
+            owner,
+            owner=None,
+            status=JobStatus.PENDING,
+            lease_until=func.now() + timedelta(seconds=delay),
+        )
+
+    async def _owned_update(
+        self, id: uuid.UUID, current_owner: str, **fields: Any
+    ) -> bool:
+        query = (
+            update(IndexingJob)
+            .where(
+                IndexingJob.id == id,
+                IndexingJob.owner == current_owner,
+                IndexingJob.status == JobStatus.RUNNING,
+            )
+            .values(**fields)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self._db.execute(query)
+        await self._db.commit()
+        return result.rowcount == 1
@@ -0,0 +1,44 @@
+from typing import Any, AsyncIterator, Dict, List
+
+from configs.Executors import llm_executor
+from ml.lifespan import llm_model
+from repositories.workers import llm_worker
+from utils.utils import iterate_in, run_in
+
+
+class LLMRepository:
+    def __init__(self):
+        self._model = llm_model
+        # with a worker URL generation runs in the llm worker process
+        self._worker = llm_worker
+
+    async def inference(self, messages: List[Dict[str, str]]) -> str:
+        if self._worker:
+            response = await self._worker.post(
+                "/api/v1/workers/llm/inference", json={"messages": messages}
+            )
+            return response.json()["text"]
+
+        llm = await self._model.aget()
+        return await run_in(llm_executor, llm.inference, messages)
+
+    async def inference_stream(
+        self, messages: List[Dict[str, str]]
+    ) -> AsyncIterator[str]:
+        # waiting for a free model happens here, before the response starts
+        if self._worker:
+            return await self._worker.stream(
+                "/api/v1/workers/llm/inference/stream", json={"messages": messages}
+            )
+
+        llm = await self._model.aget()
+        tokens = await run_in(llm_executor, llm.inference_stream, messages)
+        return iterate_in(llm_executor, tokens)
+
+    async def metrics(self) -> Dict[str, Any]:
+        if self._worker:
+            metrics = await self._worker.get_json("/api/v1/workers/llm/metrics")
+            return metrics or {"state": "unreachable"}
+
+        llm = self._model.peek()
+        return llm.metrics() if llm else {"state": self._model.state}
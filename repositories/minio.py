@@ -2,18 +2,20 @@ import io
 
 from fastapi import Depends
 from loguru import logger
+from miniopy_async import Minio
+from miniopy_async.error import S3Error
 
-from configs import Minio
 from configs.Minio import get_minio_client, base_bucket
 from schemas.minio import MinioContentType
 
 
 class MinioRepository:
+    _buckets: set[str] = set()
+
     def __init__(self, client: Minio = Depends(get_minio_client)):
         self._client = client
-        self.create_bucket(base_bucket)
 
-    def create_object_from_byte(
+    async def create_object_from_byte(
         self,
         object_path: str,
         file: io.BytesIO,
@@ -21,7 +23,8 @@ class MinioRepository:
         bucket_name: str = base_bucket,
     ) -> str:
         logger.debug("Minio - Repository - create_object_from_byte")
-        self._client.put_object(
+        await self.create_bucket(bucket_name)
+        await self._client.put_object(
             bucket_name,
             object_path,
             data=file,
@@ -31,7 +34,7 @@ class MinioRepository:
 
         return object_path
 
-    def create_object_from_file(
+    async def create_object_from_file(
         self,
         object_path: str,
         file: str,
@@ -39,7 +42,8 @@ class MinioRepository:
         bucket_name: str = base_bucket,
     ) -> str:
         logger.debug("Minio - Repository - create_object_from_file")
-        self._client.fput_object(
+        await self.create_bucket(bucket_name)
+        await self._client.fput_object(
             bucket_name,
             object_path,
             file,
@@ -48,15 +52,39 @@ class MinioRepository:
 
         return object_path
 
-    def create_bucket(self, name: str):
+    async def create_bucket(self, name: str):
+        if name in self._buckets:
+            return
         logger.debug("Minio - Repository - create_bucket")
-        found = self._client.bucket_exists(name)
+        found = await self._client.bucket_exists(name)
         if not found:
-            self._client.make_bucket(name)
+            await self._client.make_bucket(name)
+        self._buckets.add(name)
+
+    async def exists(self, object_path: str, bucket_name: str = base_bucket) -> bool:
+        logger.debug("Minio - Repository - exists")
+        await self.create_bucket(bucket_name)
+        try:
+            await self._client.stat_object(bucket_name, object_path)
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "ResourceNotFound"):
+                return False
+            raise
+        return True
+
+    async def get_object(
+        self, object_path: str, bucket_name: str = base_bucket
+    ) -> bytes:
+        logger.debug("Minio - Repository - get_object")
+        response = await self._client.get_object(bucket_name, object_path)
+        try:
+            return await response.read()
+        finally:
+            response.close()
 
-    def get_link(self, object_path: str, bucket_name: str) -> str:
+    async def get_link(self, object_path: str, bucket_name: str) -> str:
         logger.debug("Minio - Repository - get_link")
 
-        url = self._client.get_presigned_url("GET", bucket_name, object_path)
+        url = await self._client.get_presigned_url("GET", bucket_name, object_path)
 
         return url
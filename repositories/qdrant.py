@@ -1,33 +1,283 @@
+import asyncio
+import json
 import uuid
-from typing import List
+from typing import Any, AsyncIterator, Dict, List
 
-from qdrant_client.grpc import ScoredPoint
-from qdrant_client.qdrant_client import QdrantClient
+from fastapi import Depends
+from loguru import logger
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    FieldCondition,
+    Filter,
+    FilterSelector,
+    MatchValue,
+    PayloadSelectorInclude,
+    PointIdsList,
+    PointStruct,
+    Prefetch,
+    Record,
+    ScoredPoint,
+    SetPayload,
+    SetPayloadOperation,
+)
 
-from configs.Qdrant import get_client, env
+from configs.Qdrant import get_client, env, MULTIVECTOR_NAME, POOLED_VECTOR_NAME
 from schemas.processor import CreateDocumentOpts
 
 
+def to_points(opts: List[CreateDocumentOpts]) -> List[PointStruct]:
+    return [
+        PointStruct(
+            id=opt.id or uuid.uuid4().__str__(),
+            vector={
+                MULTIVECTOR_NAME: opt.vector,
+                POOLED_VECTOR_NAME: opt.pooled_vector,
+            },
+            payload=opt.metadata,
+        )
+        for opt in opts
+    ]
+
+
+# a float32 value written as REST JSON, e.g. "-0.012345678901234567,"
+FLOAT_JSON_BYTES = 24
+
+
+def estimate_size(point: PointStruct) -> int:
+    """
+    Upper estimate of the point in an upsert request body: a ColQwen2
+    multivector alone takes megabytes, so its size matters more than the count.
+    """
+    floats = 0
+    for vector in point.vector.values():
+        if vector and isinstance(vector[0], list):
+            floats += sum(len(row) for row in vector)
+        else:
+            floats += len(vector)
+    return floats * FLOAT_JSON_BYTES + len(json.dumps(point.payload, default=str))
+
+
+class QdrantUpsertBuffer:
+    """
+    Write-behind buffer: collects points and upserts them in batches of at
+    most batch_size points and max_bytes of estimated request body, so a batch
+    of image multivectors stays under Qdrant's max_request_size_mb.
+
+    flush() (or leaving the context manager) blocks until every buffered
+    point has been acknowledged by Qdrant. With wait=False the
+    acknowledgement means the point is in the write-ahead log, not that it
+    is already searchable.
+    """
+
+    def __init__(
+        self,
+        client: AsyncQdrantClient,
+        collection: str,
+        batch_size: int = 256,
+        wait: bool = True,
+        workers: int = 1,
+        max_bytes: int = 16 * 1024 * 1024,
+    ):
+        self._client = client
+        self._collection = collection
+        self._batch_size = batch_size
+        self._max_bytes = max_bytes
+        self._wait = wait
+        self._workers = workers
+        self._points: List[PointStruct] = []
+        self._bytes = 0
+        self._in_flight: set[asyncio.Task] = set()
+        self.total = 0
+
+    async def add(self, opts: List[CreateDocumentOpts]):
+        for point in to_points(opts):
+            size = estimate_size(point)
+            # a point larger than max_bytes still goes, alone in its batch
+            if self._points and self._bytes + size > self._max_bytes:
+                await self._send_buffered()
+            self._points.append(point)
+            self._bytes += size
+            if len(self._points) >= self._batch_size:
+                await self._send_buffered()
+
+    async def flush(self):
+        logger.debug("Qdrant - Repository - flush")
+        if self._points:
+            await self._send_buffered()
+        await self._drain(0)
+
+    async def __aenter__(self) -> "QdrantUpsertBuffer":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            await self.flush()
+            return
+
+        # the job already failed: wait for in-flight batches but drop the rest
+        self._points, self._bytes = [], 0
+        try:
+            await self._drain(0)
+        except Exception as e:
+            logger.error(f"Qdrant - Repository - flush after failure: {e}")
+
+    async def _send_buffered(self):
+        batch, self._points, self._bytes = self._points, [], 0
+        await self._send(batch)
+
+    async def _send(self, batch: List[PointStruct]):
+        self.total += len(batch)
+        if self._workers <= 1:
+            await self._upsert(batch)
+            return
+
+        # backpressure: at most one upsert in flight per worker
+        await self._drain(self._workers - 1)
+        self._in_flight.add(asyncio.create_task(self._upsert(batch)))
+
+    async def _upsert(self, batch: List[PointStruct]):
+        await self._client.upsert(
+            collection_name=self._collection, points=batch, wait=self._wait
+        )
+
+    async def _drain(self, limit: int):
+        while len(self._in_flight) > limit:
+            done, self._in_flight = await asyncio.wait(
+                self._in_flight, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                task.result()
+
+
 class QdrantRepository:
-    def __init__(self, client: QdrantClient = get_client()):
+    def __init__(self, client: AsyncQdrantClient = Depends(get_client)):
         self.client = client
         self.collection = env.QDRANT_COLLECTION
 
-    def create_document(self, opts: List[CreateDocumentOpts]):
-        self.client.upsert(
+    async def create_document(self, opts: List[CreateDocumentOpts]):
+        async with self.buffer(wait=True, workers=1) as buffer:
+            await buffer.add(opts)
+
+    async def delete_document(self, id: str):
+        await self.client.delete(
+            collection_name=self.collection,
+            points_selector=FilterSelector(
+                filter=Filter(
+                    must=[FieldCondition(key="id", match=MatchValue(value=id))]
+                )
+            ),
+            wait=True,
+        )
+
+    async def get_document_points(
+        self, id: str, fields: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        logger.debug("Qdrant - Repository - get_document_points")
+        points = {}
+        offset = None
+        while True:
+            records, offset = await self.client.scroll(
+                collection_name=self.collection,
+                scroll_filter=Filter(
+                    must=[FieldCondition(key="id", match=MatchValue(value=id))]
+                ),
+                limit=env.QDRANT_UPSERT_BATCH_SIZE,
+                offset=offset,
+                with_payload=PayloadSelectorInclude(include=fields),
+                with_vectors=False,
+            )
+            points.update((str(record.id), record.payload or {}) for record in records)
+            if offset is None:
+                return points
+
+    async def set_payloads(self, payloads: Dict[str, Dict[str, Any]]):
+        logger.debug("Qdrant - Repository - set_payloads")
+        if not payloads:
+            return
+        await self.client.batch_update_points(
             collection_name=self.collection,
-            points=[
-                {
-                    "id": uuid.uuid4().__str__(),
-                    "vector": opt.vector,
-                    "payload": opt.metadata,
-                }
-                for opt in opts
+            update_operations=[
+                SetPayloadOperation(
+                    set_payload=SetPayload(payload=payload, points=[id])
+                )
+                for id, payload in payloads.items()
             ],
+            wait=True,
         )
 
-    def get_document(self, query_vector: List[float], top_k: int) -> list[ScoredPoint]:
-        hits = self.client.search(
-            collection_name=self.collection, query_vector=query_vector, limit=top_k
+    async def set_points_payload(self, ids: List[str], payload: Dict[str, Any]):
+        logger.debug("Qdrant - Repository - set_points_payload")
+        if not ids:
+            return
+        await self.client.set_payload(
+            collection_name=self.collection,
+            payload=payload,
+            points=ids,
+            wait=True,
         )
-        return hits
+
+    async def delete_points(self, ids: List[str]):
+        logger.debug("Qdrant - Repository - delete_points")
+        if not ids:
+            return
+        await self.client.delete(
+            collection_name=self.collection,
+            points_selector=PointIdsList(points=ids),
+            wait=True,
+        )
+
+    def buffer(
+        self,
+        batch_size: int | None = None,
+        wait: bool | None = None,
+        workers: int | None = None,
+    ) -> QdrantUpsertBuffer:
+        return QdrantUpsertBuffer(
+            self.client,
+            self.collection,
+            batch_size=batch_size or env.QDRANT_UPSERT_BATCH_SIZE,
+            wait=env.QDRANT_UPSERT_WAIT if wait is None else wait,
+            workers=workers or env.QDRANT_UPSERT_WORKERS,
+            max_bytes=env.QDRANT_UPSERT_MAX_MB * 1024 * 1024,
+        )
+
+    async def get_document(
+        self,
+        query_vector: List[List[float]],
+        top_k: int,
+        pooled_vector: List[float] | None = None,
+        prefetch_limit: int = 100,
+    ) -> list[ScoredPoint]:
+        prefetch = None
+        if pooled_vector is not None:
+            prefetch = Prefetch(
+                query=pooled_vector,
+                using=POOLED_VECTOR_NAME,
+                limit=max(prefetch_limit, top_k),
+            )
+
+        response = await self.client.query_points(
+            collection_name=self.collection,
+            prefetch=prefetch,
+            query=query_vector,
+            using=MULTIVECTOR_NAME,
+            limit=top_k,
+        )
+        return response.points
+
+    async def iter_points(
+        self, collection: str, batch_size: int
+    ) -> AsyncIterator[List[Record]]:
+        offset = None
+        while True:
+            records, offset = await self.client.scroll(
+                collection_name=collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            if records:
+                yield records
+            if offset is None:
+                return
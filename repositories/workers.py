@@ -0,0 +1,105 @@
+import json
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from loguru import logger
+
+from configs.Environment import get_environment_variables
+from errors.errors import ErrBadRequest, ErrServiceUnavailable
+
+env = get_environment_variables()
+
+
+class WorkerClient:
+    """
+    HTTP client of a model worker process (APP_ROLE embedding or llm).
+
+    A worker that is unreachable or overloaded surfaces as ErrServiceUnavailable,
+    so callers answer 503 exactly as they do when a local model is busy.
+    """
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self._client = httpx.AsyncClient(
+            base_url=url,
+            timeout=httpx.Timeout(env.WORKER_TIMEOUT, connect=5),
+            limits=httpx.Limits(max_connections=env.WORKER_MAX_CONNECTIONS),
+        )
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        try:
+            response = await self._client.post(path, **kwargs)
+        except httpx.TransportError as e:
+            raise self._unavailable(e)
+        self._check(response)
+        return response
+
+    async def stream(self, path: str, **kwargs) -> AsyncIterator[str]:
+        """
+        Starts a server-sent event stream and returns its tokens; errors of the
+        worker are raised here, before the caller starts its own response.
+        """
+        request = self._client.build_request("POST", path, **kwargs)
+        try:
+            response = await self._client.send(request, stream=True)
+        except httpx.TransportError as e:
+            raise self._unavailable(e)
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+            self._check(response)
+        return self._events(response)
+
+    async def get_json(self, path: str) -> Optional[Dict[str, Any]]:
+        # health and metrics only, a worker that does not answer is reported, not raised
+        try:
+            response = await self._client.get(path, timeout=2)
+            return response.json() if response.status_code == 200 else None
+        except (httpx.HTTPError, ValueError):
+            return None
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def _events(self, response: httpx.Response) -> AsyncIterator[str]:
+        try:
+            async for line in response.aiter_lines():
+                if line.startswith("event: done"):
+                    return
+                if line.startswith("data: "):
+                    yield json.loads(line[len("data: ") :])["token"]
+        except httpx.TransportError as e:
+            raise self._unavailable(e)
+        finally:
+            await response.aclose()
+        raise ErrServiceUnavailable(f"{self.name} worker closed the stream")
+
+    def _check(self, response: httpx.Response):
+        if response.status_code == 503:
+            raise ErrServiceUnavailable(f"{self.name} worker is busy")
+        if response.status_code == 400:
+            # e.g. an image the worker cannot decode, the caller answers 400 too
+            raise ErrBadRequest(response.json().get("detail", "Bad request"))
+        response.raise_for_status()
+
+    def _unavailable(self, e: Exception) -> ErrServiceUnavailable:
+        logger.warning(f"{self.name} worker - {self.url} - {e}")
+        return ErrServiceUnavailable(f"{self.name} worker is unreachable")
+
+
+def make_worker(name: str, url: str) -> Optional[WorkerClient]:
+    # a worker process serves its own model, it never forwards to another worker
+    if not url or env.APP_ROLE == name:
+        return None
+    return WorkerClient(name, url)
+
+
+embedding_worker = make_worker("embedding", env.EMBEDDING_WORKER_URL)
+llm_worker = make_worker("llm", env.LLM_WORKER_URL)
+
+
+async def close_workers():
+    for worker in (embedding_worker, llm_worker):
+        if worker:
+            await worker.close()
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+
+from schemas.health import Readiness
+from services.health import HealthService
+
+router = APIRouter(prefix="/api/v1/health", tags=["health"])
+
+
+@router.get("/live", summary="the process is up")
+async def live():
+    return {"status": "ok"}
+
+
+@router.get(
+    "/ready",
+    summary="the collection exists and every model of the role is loaded",
+    response_model=Readiness,
+)
+async def ready(health_service: HealthService = Depends()):
+    readiness = await health_service.readiness()
+    return JSONResponse(
+        readiness.model_dump(), status_code=200 if readiness.ready else 503
+    )
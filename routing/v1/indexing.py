@@ -1,46 +1,85 @@
-from fastapi import APIRouter, UploadFile, File, Depends
+import uuid
+
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Depends
 
 from repositories.integration import ConfluenceIntegration, NotionIntegration
+from schemas.jobs import IndexingJobCreated, IndexingJobResponse
+from schemas.processor import DocumentKind
 from services.indexing import IndexingService
+from services.jobs import IndexingJobService, ingest_confluence
 
 router = APIRouter(prefix="/api/v1/indexing", tags=["indexing"])
 
+# documents are identified by kind and file name
+REPLACES = (
+    "A file with the same name as an indexed document of the same kind replaces "
+    "that document; uploads of one document are indexed one after another."
+)
+
 
 @router.post("/notion/{page_id}", summary="indexing the notion page")
-def indexing_notion(
+async def indexing_notion(
     page_id: str, api_token: str, indexing_service: IndexingService = Depends()
 ):
-    indexing_service.integrate_external(page_id, NotionIntegration(api_token))
+    await indexing_service.integrate_external(page_id, NotionIntegration(api_token))
 
 
-@router.post("/confluence/{page_id}", summary="indexing the confluence page")
-def indexing_confluence(
-    page_id: str,
+@router.post(
+    "/confluence/{label}", summary="indexing the confluence pages with a label"
+)
+async def indexing_confluence(
+    label: str,
+    url: str,
     username: str,
     password: str,
-    indexing_service: IndexingService = Depends(),
+    background_tasks: BackgroundTasks,
 ):
-    indexing_service.integrate_external(
-        page_id, ConfluenceIntegration(username, password)
-    )
+    # pages are submitted as pdf indexing jobs while they download
+    confluence = ConfluenceIntegration(url, username, password)
+    background_tasks.add_task(ingest_confluence, confluence, label)
 
 
-@router.post("/file/pdf", summary="indexing the pdf file")
-def indexing_pdf(
-    indexing_service: IndexingService = Depends(), pdf: UploadFile = File(...)
+@router.post(
+    "/file/pdf",
+    summary="indexing the pdf file",
+    description=REPLACES,
+    response_model=IndexingJobCreated,
+)
+async def indexing_pdf(
+    job_service: IndexingJobService = Depends(), pdf: UploadFile = File(...)
 ):
-    indexing_service.indexing_pdf(pdf.filename, pdf.file.read())
+    job = await job_service.submit(DocumentKind.PDF, pdf.filename, await pdf.read())
+    return IndexingJobCreated(job_id=job.id)
 
 
-@router.post("/file/docx", summary="indexing the docx file")
-def indexing_docx(
-    indexing_service: IndexingService = Depends(), docx: UploadFile = File(...)
+@router.post(
+    "/file/docx",
+    summary="indexing the docx file",
+    description=REPLACES,
+    response_model=IndexingJobCreated,
+)
+async def indexing_docx(
+    job_service: IndexingJobService = Depends(), docx: UploadFile = File(...)
 ):
-    indexing_service.indexing_docx(docx.filename, docx.file.read())
+    job = await job_service.submit(DocumentKind.DOCX, docx.filename, await docx.read())
+    return IndexingJobCreated(job_id=job.id)
 
 
-@router.post("/file/pptx", summary="indexing the ptpx file")
-def indexing_pptx(
-    indexing_service: IndexingService = Depends(), pptx: UploadFile = File(...)
+@router.post(
+    "/file/pptx",
+    summary="indexing the ptpx file",
+    description=REPLACES,
+    response_model=IndexingJobCreated,
+)
+async def indexing_pptx(
+    job_service: IndexingJobService = Depends(), pptx: UploadFile = File(...)
 ):
-    indexing_service.indexing_pptx(pptx.filename, pptx.file.read())
+    job = await job_service.submit(DocumentKind.PPTX, pptx.filename, await pptx.read())
+    return IndexingJobCreated(job_id=job.id)
+
+
+@router.get(
+    "/jobs/{id}", summary="indexing job status", response_model=IndexingJobResponse
+)
+async def get_indexing_job(id: uuid.UUID, job_service: IndexingJobService = Depends()):
+    return await job_service.get(id)
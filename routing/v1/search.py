@@ -1,21 +1,55 @@
 from fastapi import APIRouter, UploadFile, File, Depends
+from fastapi.responses import StreamingResponse
 
 from schemas.search import SearchByTextRequest
 from services.search import SearchService
+from utils.utils import sse
 
 router = APIRouter(prefix="/api/v1/search", tags=["search"])
 
 
 @router.post("/image", summary="indexing the pdf file")
-def search_by_image(
+async def search_by_image(
     search_service: SearchService = Depends(), image: UploadFile = File(...)
 ):
-    return search_service.search_by_image(image.file.read())
+    return await search_service.search_by_image(await image.read())
+
+
+@router.post("/image/stream", summary="search by image, streaming the answer")
+async def search_by_image_stream(
+    search_service: SearchService = Depends(), image: UploadFile = File(...)
+):
+    return StreamingResponse(
+        sse(await search_service.search_by_image_stream(await image.read())),
+        media_type="text/event-stream",
+    )
 
 
 @router.post("/text", summary="indexing the docx file")
-def search_by_text(
+async def search_by_text(
     opts: SearchByTextRequest,
     search_service: SearchService = Depends(),
 ):
-    return search_service.search_by_text(opts.text)
+    return await search_service.search_by_text(
+        opts.text, opts.top_k, opts.prefetch_limit
+    )
+
+
+@router.post("/text/stream", summary="search by text, streaming the answer")
+async def search_by_text_stream(
+    opts: SearchByTextRequest,
+    search_service: SearchService = Depends(),
+):
+    return StreamingResponse(
+        sse(
+            await search_service.search_by_text_stream(
+                opts.text, opts.top_k, opts.prefetch_limit
+            )
+        ),
+        media_type="text/event-stream",
+    )
+
+
+@router.get("/metrics", summary="search and llm cache metrics")
+async def search_metrics(search_service: SearchService = Depends()):
+    return await search_service.metrics()
@@ -0,0 +1,70 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, File, Request, UploadFile
+from fastapi.responses import Response, StreamingResponse
+
+from schemas.workers import EmbedTextRequest, EmbedTextsRequest, InferenceRequest
+from services.workers import EmbeddingWorkerService, LLMWorkerService
+from utils.utils import sse
+
+# called by API processes only, embeddings travel as npz archives
+
+embedding_router = APIRouter(
+    prefix="/api/v1/workers/embedding", tags=["embedding worker"]
+)
+
+llm_router = APIRouter(prefix="/api/v1/workers/llm", tags=["llm worker"])
+
+NPZ = "application/octet-stream"
+
+
+@embedding_router.post("/text", summary="embedding of a search query")
+async def embed_text(
+    opts: EmbedTextRequest, worker: EmbeddingWorkerService = Depends()
+):
+    return Response(await worker.embed_text(opts.text), media_type=NPZ)
+
+
+@embedding_router.post("/image", summary="embedding of a search image sent as body")
+async def embed_image(request: Request, worker: EmbeddingWorkerService = Depends()):
+    return Response(await worker.embed_image(await request.body()), media_type=NPZ)
+
+
+@embedding_router.post("/texts", summary="embeddings of document chunks")
+async def embed_texts(
+    opts: EmbedTextsRequest, worker: EmbeddingWorkerService = Depends()
+):
+    return Response(await worker.embed_texts(opts.texts, opts.lengths), media_type=NPZ)
+
+
+@embedding_router.post("/images", summary="embeddings of document images")
+async def embed_images(
+    worker: EmbeddingWorkerService = Depends(), images: List[UploadFile] = File(...)
+):
+    content = [await image.read() for image in images]
+    return Response(await worker.embed_images(content), media_type=NPZ)
+
+
+@embedding_router.get("/metrics", summary="embedding cache metrics")
+async def embedding_metrics(worker: EmbeddingWorkerService = Depends()):
+    return await worker.metrics()
+
+
+@llm_router.post("/inference", summary="generate an answer")
+async def inference(opts: InferenceRequest, worker: LLMWorkerService = Depends()):
+    return {"text": await worker.inference(opts.messages)}
+
+
+@llm_router.post("/inference/stream", summary="generate an answer, streaming tokens")
+async def inference_stream(
+    opts: InferenceRequest, worker: LLMWorkerService = Depends()
+):
+    return StreamingResponse(
+        sse(await worker.inference_stream(opts.messages)),
+        media_type="text/event-stream",
+    )
+
+
+@llm_router.get("/metrics", summary="llm pool and prefix cache metrics")
+async def llm_metrics(worker: LLMWorkerService = Depends()):
+    return await worker.metrics()
@@ -0,0 +1,12 @@
+from typing import Dict, Optional
+
+from pydantic import BaseModel
+
+
+class Readiness(BaseModel):
+    ready: bool
+    role: str
+    # None for model workers, they do not use the collection
+    qdrant: Optional[bool]
+    models: Dict[str, str]
+    workers: Dict[str, bool]
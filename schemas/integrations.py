@@ -8,6 +8,7 @@ class ResponseType(enum.Enum):
 
 
 class PageResponse(BaseModel):
+    id: str | None = None
     title: str
     content: bytes | str
     type: ResponseType  # the type of the returning document
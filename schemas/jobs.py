@@ -0,0 +1,24 @@
+import uuid
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict
+
+from models.IndexingJob import JobStatus
+
+
+class IndexingJobCreated(BaseModel):
+    job_id: uuid.UUID
+
+
+class IndexingJobResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: uuid.UUID
+    title: str
+    kind: str
+    status: JobStatus
+    chunks_done: int
+    chunks_total: int | None
+    error: str | None
+    created_at: datetime | None
+    updated_at: datetime | None
@@ -1,8 +1,17 @@
+import enum
 from typing import List, Any
 
 from pydantic import BaseModel
 
 
+class DocumentKind(enum.Enum):
+    PDF = "pdf"
+    DOCX = "docx"
+    PPTX = "pptx"
+
+
 class CreateDocumentOpts(BaseModel):
-    vector: List[float]
+    id: str | None = None
+    vector: List[List[float]]
+    pooled_vector: List[float]
     metadata: dict[str, Any]
@@ -1,5 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class SearchByTextRequest(BaseModel):
     text: str
+    top_k: int = Field(default=1, ge=1, le=20)
+    prefetch_limit: int = Field(default=100, ge=1, le=1000)
@@ -0,0 +1,17 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class EmbedTextRequest(BaseModel):
+    text: str
+
+
+class EmbedTextsRequest(BaseModel):
+    texts: List[str]
+    # token counts measured by the chunker, used to group texts of similar length
+    lengths: Optional[List[Optional[int]]] = None
+
+
+class InferenceRequest(BaseModel):
+    messages: List[Dict[str, str]]
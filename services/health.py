@@ -0,0 +1,33 @@
+from configs import Qdrant
+from configs.Environment import get_environment_variables
+from ml.lifespan import ROLE_MODELS, local_models
+from repositories.workers import embedding_worker, llm_worker
+from schemas.health import Readiness
+
+env = get_environment_variables()
+
+# roles that serve the API and therefore need the collection
+API_ROLES = ("all", "indexing", "search")
+
+
+class HealthService:
+    async def readiness(self) -> Readiness:
+        models = {model.name: model.state for model in local_models(env.APP_ROLE)}
+
+        names = {model.name for model in ROLE_MODELS[env.APP_ROLE]}
+        workers = {
+            worker.name: await worker.get_json("/api/v1/health/ready") is not None
+            for worker in (embedding_worker, llm_worker)
+            if worker and worker.name in names
+        }
+
+        qdrant = Qdrant.collection_ready if env.APP_ROLE in API_ROLES else None
+        return Readiness(
+            ready=qdrant is not False
+            and all(state == "ready" for state in models.values())
+            and all(workers.values()),
+            role=env.APP_ROLE,
+            qdrant=qdrant,
+            models=models,
+            workers=workers,
+        )
@@ -1,15 +1,73 @@
-import uuid
-from typing import Any
+import asyncio
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Iterator, List
 
 from fastapi import Depends
 from io import BytesIO
+from loguru import logger
 
+from configs.Environment import get_environment_variables
+from configs.Executors import parsing_executor, pdf_executor
+from ml.chunking import Chunk, TokenChunker, TokenCounter
+from ml.config import PageRenderOptions
+from ml.embedding import mean_pool
 from ml.indexing import PdfProcessor, DocxProcessor, PptxProcessor
+from ml.lifespan import tokenizer_model
 from repositories.embedding import EmbeddingRepository
 from repositories.integration import BaseIntegrator
-from repositories.qdrant import QdrantRepository
-from schemas.processor import CreateDocumentOpts
+from repositories.qdrant import QdrantRepository, QdrantUpsertBuffer
+from schemas.processor import CreateDocumentOpts, DocumentKind
 from services.minio import MinioService
+from utils.utils import batched, content_hash, iterate_in, stable_id
+
+env = get_environment_variables()
+
+CHUNKER = (
+    partial(
+        TokenChunker,
+        TokenCounter(tokenizer_model.get),
+        env.CHUNK_MAX_TOKENS,
+        env.CHUNK_OVERLAP_TOKENS,
+    )
+    if env.CHUNKING_MODE == "tokens"
+    else None
+)
+
+PROCESSORS = {
+    DocumentKind.PDF: partial(
+        PdfProcessor,
+        min_image_pixels=env.IMAGE_MIN_PIXELS,
+        chunker=CHUNKER,
+        executor=pdf_executor,
+        pages_per_task=env.PDF_EXTRACT_PAGES_PER_TASK,
+        max_in_flight=2 * env.PDF_EXTRACT_WORKERS,
+        render=PageRenderOptions(
+            mode=env.PDF_PAGE_RENDER,
+            dpi=env.PDF_RENDER_DPI,
+            max_text_density=env.PDF_RENDER_MAX_TEXT_DENSITY,
+            min_drawings=env.PDF_RENDER_MIN_DRAWINGS,
+            cache_dir=env.PDF_RENDER_CACHE_DIR,
+        ),
+    ),
+    DocumentKind.DOCX: partial(
+        DocxProcessor, min_image_pixels=env.IMAGE_MIN_PIXELS, chunker=CHUNKER
+    ),
+    DocumentKind.PPTX: partial(
+        PptxProcessor, min_image_pixels=env.IMAGE_MIN_PIXELS, chunker=CHUNKER
+    ),
+}
+
+# called with (chunks done, chunks total or None while parsing is in progress)
+Progress = Callable[[int, int | None], Awaitable[None]]
+
+# payload fields needed to tell which points of a document can be kept
+DOCUMENT_FIELDS = ["type", "chunk_hash", "document_hash"]
+
+
+def document_id(kind: DocumentKind, title: str) -> str:
+    # a document is identified by its kind and title: uploading another file under
+    # the same name replaces the earlier document
+    return stable_id(kind.value, title)
 
 
 class IndexingService:
@@ -23,66 +81,185 @@ class IndexingService:
         self._embedding_repo = embedding
         self._qdrant_repo = qdrant_repo
 
-    def integrate_external(self, page_id: str, integrator: BaseIntegrator):
-        content = integrator.fetch_data(page_id)
+    async def integrate_external(self, page_id: str, integrator: BaseIntegrator):
+        content = await asyncio.to_thread(integrator.fetch_data, page_id)
+
+        embedding = await self._embedding_repo.extract_text_embeddings(content)
+
+        await self._qdrant_repo.create_document(
+            [
+                CreateDocumentOpts(
+                    vector=embedding.tolist(),
+                    pooled_vector=mean_pool(embedding).tolist(),
+                    metadata={"source": integrator.source(), "page_id": page_id},
+                )
+            ]
+        )
+
+    async def save_source(self, kind: DocumentKind, title: str, content: bytes) -> str:
+        save = {
+            DocumentKind.PDF: self._minio.save_pdf,
+            DocumentKind.DOCX: self._minio.save_docx,
+            DocumentKind.PPTX: self._minio.save_pptx,
+        }[kind]
+        return await save(content_hash(content), title, BytesIO(content))
+
+    async def index(
+        self,
+        kind: DocumentKind,
+        title: str,
+        content: bytes,
+        minio_path: str,
+        progress: Progress | None = None,
+    ):
+        id = document_id(kind, title)
+        document_hash = content_hash(content)
+
+        existing = await self._qdrant_repo.get_document_points(id, DOCUMENT_FIELDS)
+        # document_hash is written last, so it marks a completely indexed revision
+        if existing and all(
+            point.get("document_hash") == document_hash for point in existing.values()
+        ):
+            logger.info(f"Indexing - {kind.value}/{title} is unchanged")
+            if progress:
+                chunks = sum(point.get("type") == "text" for point in existing.values())
+                await progress(chunks, chunks)
+            return
+
+        processor = PROCESSORS[kind]()
 
-        self._qdrant_repo.create_document(
-            CreateDocumentOpts(
-                vector=self._embedding_repo.extract_text_embeddings(content).tolist(),
-                metadata={"source": integrator.source(), "page_id": page_id},
-            )
+        produced = await self._process_chunks(
+            processor.process(content),
+            {"id": id, "minio_path": minio_path},
+            existing,
+            progress,
         )
 
-    def indexing_pdf(self, title: str, pdf: bytes):
-        id = uuid.uuid4()
-        minio_path = self._minio.save_pdf(id, title, BytesIO(pdf))
+        await self._qdrant_repo.delete_points(
+            [point_id for point_id in existing if point_id not in produced]
+        )
+        # only the points of this revision, never ones another run left behind
+        await self._qdrant_repo.set_points_payload(
+            list(produced), {"document_hash": document_hash}
+        )
 
-        processor = PdfProcessor()
+    async def _process_chunks(
+        self,
+        chunks: Iterator[Chunk],
+        document: dict[str, Any],
+        existing: Dict[str, Dict[str, Any]],
+        progress: Progress | None = None,
+    ) -> set[str]:
+        done = 0
+        produced: set[str] = set()
+        # parsing runs ahead of embedding by at most INDEXING_QUEUE_SIZE batches,
+        # and upserts overlap with embedding through the buffer workers
+        queue: asyncio.Queue = asyncio.Queue(env.INDEXING_QUEUE_SIZE)
+        parser = asyncio.create_task(self._parse(chunks, queue))
+        try:
+            async with self._qdrant_repo.buffer() as buffer:
+                while (batch := await queue.get()) is not None:
+                    if isinstance(batch, Exception):
+                        raise batch
+                    await self._process_batch(
+                        batch, document, existing, produced, buffer
+                    )
+                    done += len(batch)
+                    if progress:
+                        await progress(done, None)
+        finally:
+            parser.cancel()
+            await asyncio.gather(parser, return_exceptions=True)
 
-        for chunk in processor.process(pdf):
-            self._process_chunk(chunk, minio_path, id)
+        if progress:
+            await progress(done, done)
+        return produced
 
-    def indexing_docx(self, title: str, docx: bytes):
-        id = uuid.uuid4()
-        minio_path = self._minio.save_docx(id, title, BytesIO(docx))
+    @staticmethod
+    async def _parse(chunks: Iterator[Chunk], queue: asyncio.Queue):
+        # parsing is CPU-bound, so the chunk generator is advanced off the event loop;
+        # a batch spans several forward passes, so the embedder can bucket by length
+        size = env.EMBEDDING_MAX_BATCH_SIZE * env.INDEXING_BUCKET_BATCHES
+        try:
+            async for batch in iterate_in(parsing_executor, batched(chunks, size)):
+                await queue.put(batch)
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(None)
 
-        processor = DocxProcessor()
+    async def _process_batch(
+        self,
+        chunks: List[Chunk],
+        document: dict[str, Any],
+        existing: Dict[str, Dict[str, Any]],
+        produced: set[str],
+        buffer: QdrantUpsertBuffer,
+    ):
+        texts = []
+        images = []
+        reused = {}
 
-        for chunk in processor.process(docx):
-            self._process_chunk(chunk, minio_path, id)
+        for chunk in chunks:
+            text = chunk.text
+            metadata = chunk.metadata()
 
-    def indexing_pptx(self, title: str, pptx: bytes):
-        id = uuid.uuid4()
-        minio_path = self._minio.save_pptx(id, title, BytesIO(pptx))
+            chunk_images: List[bytes] = chunk.images
+            image_hashes = [content_hash(image) for image in chunk_images]
 
-        processor = PptxProcessor()
+            chunk_hash = content_hash(text, *image_hashes)
+            metadata.update(document, text=text, chunk_hash=chunk_hash)
 
-        for chunk in processor.process(pptx):
-            self._process_chunk(chunk, minio_path, id)
+            text_id = stable_id(document["id"], chunk_hash, "text")
+            # a chunk repeated inside the document is stored once
+            if text_id not in produced:
+                produced.add(text_id)
+                # unchanged chunk: keep the vectors, refresh positions and source path
+                if text_id in existing:
+                    reused[text_id] = {**metadata, "type": "text"}
+                else:
+                    texts.append((text_id, metadata))
 
-    def _process_chunk(self, chunk: dict[str, Any], minio_path: str, id: uuid.UUID):
-        text = chunk["chunk"]
-        metadata = chunk["metadata"]
+            for image, image_hash in zip(chunk_images, image_hashes):
+                # logos and footers repeated on every page are stored once per document
+                image_id = stable_id(document["id"], image_hash, "image")
+                if image_id in produced:
+                    continue
+                produced.add(image_id)
+                if image_id in existing:
+                    reused[image_id] = {**metadata, "type": "image"}
+                else:
+                    images.append((image_id, image, metadata))
 
-        images = metadata.pop("images", None)
+        await self._qdrant_repo.set_payloads(reused)
 
-        metadata["minio_path"] = minio_path
-        metadata["text"] = text
-        metadata["id"] = id
+        image_embeddings = await self._embedding_repo.extract_image_embeddings_batch(
+            [image for _, image, _ in images]
+        )
+        text_embeddings = await self._embedding_repo.extract_text_embeddings_batch(
+            [metadata["text"] for _, metadata in texts],
+            [metadata.get("token_count") for _, metadata in texts],
+        )
 
-        for image in images:
-            self._qdrant_repo.create_document(
+        await buffer.add(
+            [
                 CreateDocumentOpts(
-                    vector=self._embedding_repo.extract_image_embeddings(
-                        image
-                    ).tolist(),
-                    metadata=metadata,
+                    id=point_id,
+                    vector=embedding.tolist(),
+                    pooled_vector=mean_pool(embedding).tolist(),
+                    metadata={**metadata, "type": "image"},
                 )
-            )
-
-        self._qdrant_repo.create_document(
-            CreateDocumentOpts(
-                vector=self._embedding_repo.extract_text_embeddings(text).tolist(),
-                metadata=metadata,
-            )
+                for embedding, (point_id, _, metadata) in zip(image_embeddings, images)
+                # undecodable images are dropped, their chunk keeps the text point
+                if embedding is not None
+            ]
+            + [
+                CreateDocumentOpts(
+                    id=point_id,
+                    vector=embedding.tolist(),
+                    pooled_vector=mean_pool(embedding).tolist(),
+                    metadata={**metadata, "type": "text"},
+                )
+                for embedding, (point_id, metadata) in zip(text_embeddings, texts)
+            ]
         )
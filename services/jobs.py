@@ -0,0 +1,222 @@
+import asyncio
+import uuid
+from typing import AsyncIterator, List
+
+from fastapi import Depends
+from loguru import logger
+
+from configs.Database import async_session
+from configs.Environment import get_environment_variables
+from configs.Minio import minio_client
+from configs.Qdrant import async_client
+from errors.errors import ErrServiceUnavailable
+from models.IndexingJob import IndexingJob, JobStatus
+from repositories.embedding import EmbeddingRepository
+from repositories.integration import ConfluenceIntegration
+from repositories.job import IndexingJobRepository, document_lock
+from repositories.minio import MinioRepository
+from repositories.qdrant import QdrantRepository
+from schemas.integrations import PageResponse
+from schemas.processor import DocumentKind
+from services.indexing import IndexingService, Progress, document_id
+from services.minio import MinioService
+from services.mixins.crud import CRUDServiceMixin
+
+env = get_environment_variables()
+
+# how long a job waits for a model that is still loading, or for another run
+# of the same document, before it is retried
+RETRY_SECONDS = 15
+
+
+class IndexingJobQueue:
+    """
+    In-process worker pool for indexing jobs. The queue only carries job ids;
+    the job rows and the uploaded sources in Minio are the durable state.
+
+    Every API process runs its own queue, so a job is only run after it is
+    claimed in the database, and the claim is a lease its runner keeps
+    extending. Each queue periodically picks up pending jobs and jobs whose
+    runner died, from any process.
+    """
+
+    def __init__(self, concurrency: int, lease: float):
+        self._concurrency = concurrency
+        self._lease = lease
+        self._queue: asyncio.Queue[uuid.UUID] = asyncio.Queue()
+        self._queued: set[uuid.UUID] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    def enqueue(self, job_id: uuid.UUID):
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def start(self):
+        self._tasks = [
+            asyncio.create_task(self._work(), name=f"indexing-worker-{n}")
+            for n in range(self._concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._sweep(), name="indexing-sweep"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _sweep(self):
+        while True:
+            try:
+                async with async_session() as db:
+                    for job in await IndexingJobRepository(db).list_claimable():
+                        self.enqueue(job.id)
+            except Exception as e:
+                logger.error(f"IndexingJob - sweep failed: {e}")
+            await asyncio.sleep(self._lease)
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"IndexingJob - {job_id} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _heartbeat(self, job_id: uuid.UUID, owner: str):
+        async with async_session() as db:
+            jobs = IndexingJobRepository(db)
+            while True:
+                await asyncio.sleep(self._lease / 3)
+                if not await jobs.renew(job_id, owner, self._lease):
+                    logger.warning(f"IndexingJob - {job_id} lease lost")
+                    return
+
+    async def _run(self, job_id: uuid.UUID):
+        owner = uuid.uuid4().hex
+        async with async_session() as db:
+            jobs = IndexingJobRepository(db)
+            job = await jobs.claim(job_id, owner, self._lease)
+            if job is None:
+                logger.debug(f"IndexingJob - {job_id} is finished or taken")
+                return
+
+            # jobs of one document run one at a time, in any process: two runs
+            # would delete each other's points and mix the revisions
+            document = document_id(DocumentKind(job.kind), job.title)
+            async with document_lock(document) as locked:
+                if not locked:
+                    logger.info(f"IndexingJob - {job_id} waits for {job.title}")
+                    await self._postpone(jobs, job_id, owner)
+                    return
+                await self._execute(jobs, job, owner)
+
+    async def _execute(self, jobs: IndexingJobRepository, job: IndexingJob, owner: str):
+        job_id = job.id
+
+        async def progress(done: int, total: int | None):
+            if not await jobs.renew(
+                job_id, owner, self._lease, chunks_done=done, chunks_total=total
+            ):
+                raise RuntimeError("the job was taken over by another process")
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, owner))
+        error = None
+        try:
+            await self._index(job, progress)
+        except Exception as e:
+            error = e
+        finally:
+            # stopped before the final update, so it cannot renew a released job
+            await self._stop(heartbeat)
+
+        if isinstance(error, ErrServiceUnavailable):
+            # the model is loading, the job waits for it instead of failing
+            logger.info(f"IndexingJob - {job_id} postponed: {error}")
+            await self._postpone(jobs, job_id, owner)
+        elif error is not None:
+            logger.error(f"IndexingJob - {job_id} failed: {error}")
+            await jobs.release(job_id, owner, status=JobStatus.FAILED, error=str(error))
+        else:
+            await jobs.release(job_id, owner, status=JobStatus.DONE)
+
+    async def _postpone(
+        self, jobs: IndexingJobRepository, job_id: uuid.UUID, owner: str
+    ):
+        await jobs.postpone(job_id, owner, RETRY_SECONDS)
+        asyncio.get_running_loop().call_later(RETRY_SECONDS, self.enqueue, job_id)
+
+    @staticmethod
+    async def _stop(task: asyncio.Task):
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    @staticmethod
+    async def _index(job: IndexingJob, progress: Progress):
+        if not job.minio_path:
+            raise RuntimeError("source document was never stored")
+
+        minio = MinioService(MinioRepository(minio_client))
+        indexing = IndexingService(
+            minio, EmbeddingRepository(), QdrantRepository(async_client)
+        )
+        content = await minio.load(job.minio_path)
+        await indexing.index(
+            DocumentKind(job.kind), job.title, content, job.minio_path, progress
+        )
+
+
+indexing_queue = IndexingJobQueue(env.INDEXING_WORKERS, env.INDEXING_JOB_LEASE)
+
+
+class IndexingJobService(CRUDServiceMixin):
+    def __init__(
+        self,
+        repo: IndexingJobRepository = Depends(),
+        indexing: IndexingService = Depends(),
+    ):
+        super().__init__(repo)
+        self._indexing = indexing
+
+    async def submit(
+        self, kind: DocumentKind, title: str, content: bytes
+    ) -> IndexingJob:
+        # the row appears with its source stored, since any process may claim it
+        minio_path = await self._indexing.save_source(kind, title, content)
+        job = await self.create(
+            IndexingJob(title=title, kind=kind.value, minio_path=minio_path)
+        )
+
+        indexing_queue.enqueue(job.id)
+        return job
+
+    async def submit_pages(self, source: str, pages: AsyncIterator[PageResponse]):
+        # every page becomes a job as soon as it arrives, so indexing of the
+        # first pages overlaps with downloading the rest
+        submitted = 0
+        async for page in pages:
+            # the page id keeps same-titled pages apart and stable across syncs
+            title = f"{page.title} [{page.id}]" if page.id else page.title
+            await self.submit(DocumentKind.PDF, title, page.content)
+            submitted += 1
+        logger.info(f"IndexingJob - {source} - submitted {submitted} pages")
+
+
+async def ingest_confluence(confluence: ConfluenceIntegration, label: str):
+    # runs after the response is sent, so it cannot use the request's session
+    source = confluence.source()
+    async with async_session() as db:
+        minio = MinioService(MinioRepository(minio_client))
+        indexing = IndexingService(
+            minio, EmbeddingRepository(), QdrantRepository(async_client)
+        )
+        jobs = IndexingJobService(IndexingJobRepository(db), indexing)
+        try:
+            await jobs.submit_pages(source, confluence.iter_pages(label))
+        except Exception as e:
+            logger.error(f"IndexingJob - {source} - ingestion failed: {e}")
+        finally:
+            confluence.close()
@@ -0,0 +1,96 @@
+"""
+Re-encodes a legacy single-vector collection into the multivector schema.
+
+Point QDRANT_COLLECTION at a new collection name, then run:
+
+    python -m services.migration <legacy collection>
+
+Legacy image points share their payload with the chunk text point and the
+image itself is not stored, so every chunk is re-encoded once from its text.
+Images come back when the source document is re-indexed.
+"""
+
+import asyncio
+import sys
+
+from fastapi import Depends
+from loguru import logger
+
+from configs.Environment import get_environment_variables
+from ml.embedding import mean_pool
+from repositories.embedding import EmbeddingRepository
+from repositories.qdrant import QdrantRepository
+from schemas.processor import CreateDocumentOpts
+
+env = get_environment_variables()
+
+
+class MigrationService:
+    def __init__(
+        self,
+        embedding_repo: EmbeddingRepository = Depends(),
+        qdrant_repo: QdrantRepository = Depends(),
+    ):
+        self._embedding_repo = embedding_repo
+        self._qdrant_repo = qdrant_repo
+
+    async def migrate_to_multivector(self, source: str, batch_size: int = 256) -> int:
+        if source == self._qdrant_repo.collection:
+            raise ValueError("source and target collections must differ")
+
+        seen = set()
+        migrated = 0
+
+        async with self._qdrant_repo.buffer() as buffer:
+            async for records in self._qdrant_repo.iter_points(source, batch_size):
+                chunks = []
+                for record in records:
+                    payload = record.payload or {}
+                    key = (
+                        payload.get("id"),
+                        payload.get("start_word"),
+                        payload.get("end_word"),
+                    )
+                    if "text" not in payload or key in seen:
+                        continue
+                    seen.add(key)
+                    chunks.append(record)
+
+                embeddings = await self._embedding_repo.extract_text_embeddings_batch(
+                    [record.payload["text"] for record in chunks],
+                    [record.payload.get("token_count") for record in chunks],
+                )
+
+                await buffer.add(
+                    [
+                        CreateDocumentOpts(
+                            id=str(record.id),
+                            vector=embedding.tolist(),
+                            pooled_vector=mean_pool(embedding).tolist(),
+                            metadata={**record.payload, "type": "text"},
+                        )
+                        for record, embedding in zip(chunks, embeddings)
+                    ]
+                )
+                migrated += len(chunks)
+                logger.info(f"Migration - {migrated} chunks re-encoded")
+
+        return migrated
+
+
+async def main(source: str):
+    from configs.Qdrant import async_client, bootstrap_collection
+    from ml.lifespan import embedding_model
+    from repositories.workers import embedding_worker
+
+    # the target collection is created with the multivector schema
+    await bootstrap_collection()
+    # unlike a request, the script waits for the model to load
+    if embedding_worker is None:
+        await asyncio.to_thread(embedding_model.get)
+    service = MigrationService(EmbeddingRepository(), QdrantRepository(async_client))
+    await service.migrate_to_multivector(source)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1]))
@@ -1,4 +1,3 @@
-import uuid
 from io import BytesIO
 
 from fastapi import Depends
@@ -11,17 +10,29 @@ class MinioService:
     def __init__(self, repo: MinioRepository = Depends()):
         self._repo = repo
 
-    def save_pdf(self, id: uuid.UUID, title: str, file: BytesIO) -> str:
-        return self._repo.create_object_from_byte(
-            f"pdf/{id.__str__()}/{title}.pdf", file, MinioContentType.PDF
+    # sources are stored under their content hash, so an unchanged re-upload is not stored twice
+
+    async def save_pdf(self, content_hash: str, title: str, file: BytesIO) -> str:
+        return await self._save(
+            f"pdf/{content_hash}/{title}.pdf", file, MinioContentType.PDF
         )
 
-    def save_docx(self, id: uuid.UUID, title: str, file: BytesIO) -> str:
-        return self._repo.create_object_from_byte(
-            f"docx/{id.__str__()}/{title}.docx", file, MinioContentType.DOCX
+    async def save_docx(self, content_hash: str, title: str, file: BytesIO) -> str:
+        return await self._save(
+            f"docx/{content_hash}/{title}.docx", file, MinioContentType.DOCX
         )
 
-    def save_pptx(self, id: uuid.UUID, title: str, file: BytesIO) -> str:
-        return self._repo.create_object_from_byte(
-            f"pptx/{id.__str__()}/{title}.pptx", file, MinioContentType.PPTX
+    async def save_pptx(self, content_hash: str, title: str, file: BytesIO) -> str:
+        return await self._save(
+            f"pptx/{content_hash}/{title}.pptx", file, MinioContentType.PPTX
         )
+
+    async def load(self, object_path: str) -> bytes:
+        return await self._repo.get_object(object_path)
+
+    async def _save(
+        self, object_path: str, file: BytesIO, content_type: MinioContentType
+    ) -> str:
+        if await self._repo.exists(object_path):
+            return object_path
+        return await self._repo.create_object_from_byte(object_path, file, content_type)
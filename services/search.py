@@ -1,9 +1,17 @@
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import torch
 from fastapi import Depends
+from qdrant_client.models import ScoredPoint
 
-from ml.constants import SYSTEM_PROMPT
-from ml.lifespan import llm
+from ml.constants import SYSTEM_PROMPT, CONTEXT_PROMPT
+from ml.embedding import mean_pool
+from ml.llm import make_message
+from repositories.answer_cache import AnswerCacheRepository, normalize_question
 from repositories.embedding import EmbeddingRepository
+from repositories.llm import LLMRepository
 from repositories.qdrant import QdrantRepository
+from utils.utils import content_hash
 
 
 class SearchService:
@@ -11,34 +19,152 @@ class SearchService:
         self,
         embedding_repo: EmbeddingRepository = Depends(),
         qdrant_repo: QdrantRepository = Depends(),
+        answer_cache: AnswerCacheRepository = Depends(),
+        llm_repo: LLMRepository = Depends(),
     ):
         self._embedding_repo = embedding_repo
         self._qdrant_repo = qdrant_repo
-
-    def search_by_image(self, image: bytes) -> str:
-        embedding = self._embedding_repo.extract_image_embeddings(image)
-
-        documents = self._qdrant_repo.get_document(embedding.tolist(), 1)
-
-        document = documents[0]
-
-        llm.add_message("system", SYSTEM_PROMPT.format(document.payload["text"]))
-
-        answer = llm.inference()
-
+        self._answer_cache = answer_cache
+        self._llm_repo = llm_repo
+
+    async def search_by_image(
+        self, image: bytes, top_k: int = 1, prefetch_limit: int = 100
+    ) -> str:
+        embedding = await self._embedding_repo.extract_image_embeddings(image)
+        documents = await self._retrieve(embedding, top_k, prefetch_limit)
+
+        return await self._answer(
+            self._image_chat(documents), "image", content_hash(image), documents
+        )
+
+    async def search_by_image_stream(
+        self, image: bytes, top_k: int = 1, prefetch_limit: int = 100
+    ) -> AsyncIterator[str]:
+        embedding = await self._embedding_repo.extract_image_embeddings(image)
+        documents = await self._retrieve(embedding, top_k, prefetch_limit)
+
+        return await self._answer_stream(
+            self._image_chat(documents), "image", content_hash(image), documents
+        )
+
+    async def search_by_text(
+        self, text: str, top_k: int = 1, prefetch_limit: int = 100
+    ) -> str:
+        embedding = await self._embedding_repo.extract_text_embeddings(text)
+        documents = await self._retrieve(embedding, top_k, prefetch_limit)
+
+        return await self._answer(
+            self._text_chat(text, documents),
+            "text",
+            normalize_question(text),
+            documents,
+            embedding,
+        )
+
+    async def search_by_text_stream(
+        self, text: str, top_k: int = 1, prefetch_limit: int = 100
+    ) -> AsyncIterator[str]:
+        embedding = await self._embedding_repo.extract_text_embeddings(text)
+        documents = await self._retrieve(embedding, top_k, prefetch_limit)
+
+        return await self._answer_stream(
+            self._text_chat(text, documents),
+            "text",
+            normalize_question(text),
+            documents,
+            embedding,
+        )
+
+    async def metrics(self) -> Dict[str, Any]:
+        return {
+            "llm": await self._llm_repo.metrics(),
+            "embedding": await self._embedding_repo.metrics(),
+            "answer_cache": self._answer_cache.metrics(),
+        }
+
+    async def _answer(
+        self,
+        messages: List[Dict[str, str]],
+        kind: str,
+        question: str,
+        documents: List[ScoredPoint],
+        embedding: Optional[torch.Tensor] = None,
+    ) -> str:
+        cached = await self._answer_cache.get(kind, documents, question, embedding)
+        if cached is not None:
+            return cached
+
+        answer = await self._llm_repo.inference(messages)
+
+        await self._answer_cache.put(kind, documents, question, answer, embedding)
         return answer
 
-    def search_by_text(self, text: str) -> str:
-        embedding = self._embedding_repo.extract_text_embeddings(text)
-
-        documents = self._qdrant_repo.get_document(embedding.tolist(), 1)
-
-        document = documents[0]
-
-        llm.add_message("system", SYSTEM_PROMPT.format(document.payload["text"]))
-
-        llm.add_message("user", text)
-
-        answer = llm.inference()
-
-        return answer
+    async def _answer_stream(
+        self,
+        messages: List[Dict[str, str]],
+        kind: str,
+        question: str,
+        documents: List[ScoredPoint],
+        embedding: Optional[torch.Tensor] = None,
+    ) -> AsyncIterator[str]:
+        cached = await self._answer_cache.get(kind, documents, question, embedding)
+        if cached is not None:
+            return self._replay(cached)
+
+        tokens = await self._llm_repo.inference_stream(messages)
+        return self._remember(tokens, kind, question, documents, embedding)
+
+    @staticmethod
+    async def _replay(answer: str) -> AsyncIterator[str]:
+        yield answer
+
+    async def _remember(
+        self,
+        tokens: AsyncIterator[str],
+        kind: str,
+        question: str,
+        documents: List[ScoredPoint],
+        embedding: Optional[torch.Tensor] = None,
+    ) -> AsyncIterator[str]:
+        parts = []
+        async for token in tokens:
+            parts.append(token)
+            yield token
+        # only a generation that ran to the end is cached
+        await self._answer_cache.put(
+            kind, documents, question, "".join(parts), embedding
+        )
+
+    def _image_chat(self, documents: List[ScoredPoint]) -> List[Dict[str, str]]:
+        return [
+            make_message("system", SYSTEM_PROMPT),
+            make_message("system", CONTEXT_PROMPT.format(self._context(documents))),
+        ]
+
+    def _text_chat(
+        self, text: str, documents: List[ScoredPoint]
+    ) -> List[Dict[str, str]]:
+        return [
+            make_message("system", SYSTEM_PROMPT),
+            make_message("system", CONTEXT_PROMPT.format(self._context(documents))),
+            make_message("user", text),
+        ]
+
+    async def _retrieve(
+        self, embedding: torch.Tensor, top_k: int, prefetch_limit: int
+    ) -> List[ScoredPoint]:
+        pooled = mean_pool(embedding).tolist()
+        # HNSW over pooled vectors picks candidates, MaxSim rescores them
+        documents = await self._qdrant_repo.get_document(
+            embedding.tolist(),
+            top_k,
+            pooled_vector=pooled,
+            prefetch_limit=prefetch_limit,
+        )
+        return documents
+
+    @staticmethod
+    def _context(documents: List[ScoredPoint]) -> str:
+        # image points share the text of their chunk
+        texts = dict.fromkeys(document.payload["text"] for document in documents)
+        return "\n\n".join(texts)
@@ -0,0 +1,56 @@
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import Depends
+
+from ml.embedding import dump_embeddings
+from repositories.embedding import EmbeddingRepository
+from repositories.llm import LLMRepository
+
+
+class EmbeddingWorkerService:
+    """
+    Serves the embedding model of this process to API processes. Concurrent
+    single queries from all of them meet in the engine's micro-batcher.
+    """
+
+    def __init__(self, embedding_repo: EmbeddingRepository = Depends()):
+        self._embedding_repo = embedding_repo
+
+    async def embed_text(self, text: str) -> bytes:
+        embedding = await self._embedding_repo.extract_text_embeddings(text)
+        return dump_embeddings([embedding])
+
+    async def embed_image(self, image: bytes) -> bytes:
+        embedding = await self._embedding_repo.extract_image_embeddings(image)
+        return dump_embeddings([embedding])
+
+    async def embed_texts(
+        self, texts: List[str], lengths: Optional[List[Optional[int]]] = None
+    ) -> bytes:
+        embeddings = await self._embedding_repo.extract_text_embeddings_batch(
+            texts, lengths
+        )
+        return dump_embeddings(embeddings)
+
+    async def embed_images(self, images: List[bytes]) -> bytes:
+        embeddings = await self._embedding_repo.extract_image_embeddings_batch(images)
+        return dump_embeddings(embeddings)
+
+    async def metrics(self) -> Dict[str, Any]:
+        return await self._embedding_repo.metrics()
+
+
+class LLMWorkerService:
+    def __init__(self, llm_repo: LLMRepository = Depends()):
+        self._llm_repo = llm_repo
+
+    async def inference(self, messages: List[Dict[str, str]]) -> str:
+        return await self._llm_repo.inference(messages)
+
+    async def inference_stream(
+        self, messages: List[Dict[str, str]]
+    ) -> AsyncIterator[str]:
+        return await self._llm_repo.inference_stream(messages)
+
+    async def metrics(self) -> Dict[str, Any]:
+        return await self._llm_repo.metrics()
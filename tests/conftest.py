@@ -0,0 +1,19 @@
+import os
+
+# settings without defaults, so modules reading them at import time load in tests
+for name, value in {
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "POSTGRES_DB": "test",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "QDRANT_HOST": "localhost",
+    "QDRANT_PORT": "6333",
+    "QDRANT_COLLECTION": "test",
+    "MINIO_HOST": "localhost:9000",
+    "MINIO_ACCESS": "test",
+    "MINIO_SECRET": "test",
+    "MINIO_BASE_BUCKET": "test",
+    "DEBUG": "false",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,108 @@
+import asyncio
+
+import numpy as np
+import torch
+from qdrant_client.models import ScoredPoint
+
+from ml.embedding import QUERY_AUGMENTATION_TOKENS, QUERY_PREFIX_TOKENS, mean_pool
+from repositories.answer_cache import (
+    AnswerCacheRepository,
+    MemoryAnswerCache,
+    normalize_question,
+)
+
+
+def point(id: int, document_hash: str = "v1") -> ScoredPoint:
+    return ScoredPoint(
+        id=id, version=0, score=1.0, payload={"document_hash": document_hash}
+    )
+
+
+def repository() -> AnswerCacheRepository:
+    repo = AnswerCacheRepository()
+    repo._cache = MemoryAnswerCache(16)
+    return repo
+
+
+def test_distinct_questions_on_the_same_chunk_do_not_collide():
+    async def run():
+        repo = repository()
+        documents = [point(1)]
+        first = normalize_question("How do I reset my password?")
+        second = normalize_question("How do I change my password?")
+
+        await repo.put("text", documents, first, "reset answer")
+        return (
+            await repo.get("text", documents, second),
+            await repo.get("text", documents, first),
+        )
+
+    assert asyncio.run(run()) == (None, "reset answer")
+
+
+def test_same_question_is_matched_regardless_of_case_and_spacing():
+    async def run():
+        repo = repository()
+        await repo.put("text", [point(1)], normalize_question("What is RAG?"), "a")
+        return await repo.get(
+            "text", [point(1)], normalize_question("  what is   rag ")
+        )
+
+    assert asyncio.run(run()) == "a"
+
+
+def test_answer_is_dropped_when_retrieval_or_document_changes():
+    async def run():
+        repo = repository()
+        question = normalize_question("what is rag")
+        await repo.put("text", [point(1)], question, "a")
+        return (
+            await repo.get("text", [point(2)], question),
+            await repo.get("text", [point(1, "v2")], question),
+            await repo.get("image", [point(1)], question),
+        )
+
+    assert asyncio.run(run()) == (None, None, None)
+
+
+def unit(rows: np.ndarray) -> np.ndarray:
+    return rows / np.linalg.norm(rows, axis=-1, keepdims=True)
+
+
+RNG = np.random.default_rng(0)
+# the "Query: " prefix and the augmentation tokens look alike in every query
+SHARED = unit(RNG.standard_normal(128))
+
+
+def query(tokens: np.ndarray) -> torch.Tensor:
+    rows = [SHARED] * QUERY_PREFIX_TOKENS
+    rows += list(tokens) + [SHARED] * QUERY_AUGMENTATION_TOKENS
+    return torch.from_numpy(np.stack(rows).astype(np.float32))
+
+
+def test_distinct_questions_do_not_collide_on_shared_query_tokens():
+    first = query(unit(RNG.standard_normal((3, 128))))
+    second = query(unit(RNG.standard_normal((3, 128))))
+    # the old gate: pooled vectors of different questions are almost the same
+    assert float(np.dot(mean_pool(first), mean_pool(second))) > 0.95
+
+    async def run():
+        repo = repository()
+        await repo.put("text", [point(1)], "reset password", "reset answer", first)
+        return await repo.get("text", [point(1)], "delete account", second)
+
+    assert asyncio.run(run()) is None
+
+
+def test_reworded_question_matches_by_question_tokens():
+    tokens = unit(RNG.standard_normal((4, 128)))
+    reworded = unit(tokens + 0.01 * RNG.standard_normal((4, 128)))
+
+    async def run():
+        repo = repository()
+        await repo.put("text", [point(1)], "how to reset", "a", query(tokens))
+        return await repo.get(
+            "text", [point(1)], "how can i reset", query(reworded[::-1])
+        )
+
+    assert asyncio.run(run()) == "a"
@@ -0,0 +1,82 @@
+from typing import List
+
+from ml.chunking import Chunk, Chunker
+
+
+def words(prefix: str, count: int, first: int = 0) -> str:
+    return " ".join(f"{prefix}{i}" for i in range(first, first + count))
+
+
+def collect(chunker: Chunker, pages: List[str]) -> List[Chunk]:
+    chunks = []
+    for unit, page in enumerate(pages, start=1):
+        chunker.tokens.add_words(page, unit)
+        chunks.extend(chunker.ready())
+    chunks.extend(chunker.finish())
+    return chunks
+
+
+def test_overlapping_windows():
+    chunks = collect(Chunker(4, 1), [words("w", 10)])
+
+    assert [chunk.text for chunk in chunks] == [
+        "w0 w1 w2 w3",
+        "w3 w4 w5 w6",
+        "w6 w7 w8 w9",
+    ]
+    assert [(chunk.start_word, chunk.end_word) for chunk in chunks] == [
+        (0, 4),
+        (3, 7),
+        (6, 10),
+    ]
+
+
+def test_incremental_feed_matches_whole_document():
+    whole = collect(Chunker(5, 2, "pages"), [words("w", 23)])
+    paged = collect(
+        Chunker(5, 2, "pages"),
+        [words("w", 7), words("w", 3, 7), words("w", 13, 10)],
+    )
+
+    assert [chunk.text for chunk in paged] == [chunk.text for chunk in whole]
+    assert paged[0].metadata() == {"start_word": 0, "end_word": 5, "pages": [1]}
+    assert paged[2].units == [1, 2, 3]
+
+
+def test_every_image_goes_to_exactly_one_chunk():
+    chunker = Chunker(4, 1)
+    chunker.tokens.add_words(words("w", 2))
+    chunker.tokens.add_image(b"first")
+    chunker.tokens.add_words(words("w", 6, 2))
+    chunker.tokens.add_image(b"second")
+    chunker.tokens.add_words(words("w", 2, 8))
+    chunker.tokens.add_image(b"trailing")
+
+    chunks = list(chunker.finish())
+
+    assert [chunk.images for chunk in chunks] == [
+        [b"first"],
+        [],
+        [b"second", b"trailing"],
+    ]
+
+
+def test_images_without_text_make_one_chunk():
+    chunker = Chunker(4, 1)
+    chunker.tokens.add_image(b"only")
+
+    chunks = list(chunker.finish())
+
+    assert len(chunks) == 1
+    assert chunks[0].text == ""
+    assert chunks[0].images == [b"only"]
+
+
+def test_cut_words_are_dropped_from_the_buffer():
+    chunker = Chunker(4, 1)
+    chunker.tokens.add_words(words("w", 100))
+    list(chunker.ready())
+
+    # only the unfinished tail is kept
+    assert chunker.tokens.word_count <= 4
+    assert chunker.tokens.base + chunker.tokens.word_count == 100
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import pytest
+from requests import HTTPError
+
+from repositories.integration import ConfluenceIntegration
+
+
+class StubConfluence:
+    """
+    Confluence REST stub: search pages with a cursor in _links.next and ignores
+    `start`, page exports can be rate limited, overloaded or broken per page.
+    """
+
+    def __init__(self, pages: int, page_size: int = 5, delay: float = 0):
+        self.pages = pages
+        self.page_size = page_size
+        self.delay = delay
+        # page id -> statuses answered before the export succeeds
+        self.failures: dict[str, list[int]] = {}
+        self.search_status = 200
+        self.searches = 0
+        self.queries: list[str] = []
+        self.exports: dict[str, int] = {}
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.handle(self)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        url = urlparse(request.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path.endswith("/rest/api/content/search"):
+            return self._search(request, query)
+        if url.path.endswith("/spaces/flyingpdf/pdfpageexport.action"):
+            return self._export(request, query["pageId"])
+        self._send(request, 404, b"{}")
+
+    def _search(self, request: BaseHTTPRequestHandler, query: dict):
+        with self._lock:
+            self.searches += 1
+            self.queries.append(query["cql"])
+        if self.search_status != 200:
+            return self._send(request, self.search_status, b"{}")
+
+        cursor = int(query.get("cursor", 0))
+        end = min(cursor + self.page_size, self.pages)
+        body = {
+            "results": [
+                {"id": str(i), "title": f"Page {i}"} for i in range(cursor, end)
+            ],
+            "_links": {},
+        }
+        if end < self.pages:
+            next_query = urlencode({"cql": query["cql"], "cursor": end})
+            body["_links"]["next"] = f"/rest/api/content/search?{next_query}"
+        self._send(request, 200, json.dumps(body).encode())
+
+    def _export(self, request: BaseHTTPRequestHandler, page_id: str):
+        with self._lock:
+            self.exports[page_id] = self.exports.get(page_id, 0) + 1
+            failures = self.failures.get(page_id)
+            status = failures.pop(0) if failures else 200
+        if status != 200:
+            return self._send(request, status, b"{}", {"Retry-After": "0"})
+
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        self._send(request, 200, b"%PDF-" + page_id.encode(), {}, "application/pdf")
+
+    @staticmethod
+    def _send(request, status, body, headers=None, content_type="application/json"):
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(body)
+
+
+def collect(confluence: ConfluenceIntegration, label: str = "docs"):
+    async def run():
+        return [page async for page in confluence.iter_pages(label)]
+
+    # a stream that never ends fails the test instead of hanging it
+    return asyncio.run(asyncio.wait_for(run(), timeout=20))
+
+
+def test_listing_follows_next_links():
+    with StubConfluence(pages=12) as stub:
+        confluence = ConfluenceIntegration(stub.url, "user", "password")
+
+        pages = collect(confluence)
+
+    assert sorted(int(page.id) for page in pages) == list(range(12))
+    assert stub.searches == 3
+    assert pages[0].content.startswith(b"%PDF-")
+
+
+def test_fetch_data_follows_next_links():
+    with StubConfluence(pages=7, page_size=3) as stub:
+        confluence = ConfluenceIntegration(stub.url, "user", "password")
+
+        pages = confluence.fetch_data("docs")
+
+    assert [page.id for page in pages] == [str(i) for i in range(7)]
+
+
+def test_rate_limited_and_overloaded_downloads_are_retried():
+    with StubConfluence(pages=6) as stub:
+        stub.failures = {"2": [429, 429], "4": [503], "5": [502, 504]}
+        confluence = ConfluenceIntegration(stub.url, "user", "password")
+
+        pages = collect(confluence)
+
+    assert sorted(int(page.id) for page in pages) == list(range(6))
+    assert stub.exports["2"] == 3
+    assert stub.exports["4"] == 2
+    assert stub.exports["5"] == 3
+
+
+def test_downloads_are_bounded_by_concurrency():
+    with StubConfluence(pages=20, delay=0.05) as stub:
+        confluence = ConfluenceIntegration(stub.url, "user", "password", concurrency=3)
+
+        pages = collect(confluence)
+
+    assert len(pages) == 20
+    assert 1 < stub.max_active <= 3
+
+
+def test_failed_download_is_skipped_and_stream_ends():
+    with StubConfluence(pages=8) as stub:
+        stub.failures = {"3": [500]}
+        confluence = ConfluenceIntegration(stub.url, "user", "password")
+
+        pages = collect(confluence)
+
+    assert sorted(int(page.id) for page in pages) == [0, 1, 2, 4, 5, 6, 7]
+
+
+def test_listing_error_ends_stream():
+    with StubConfluence(pages=8) as stub:
+        stub.search_status = 500
+        confluence = ConfluenceIntegration(stub.url, "user", "password")
+
+        with pytest.raises(HTTPError):
+            collect(confluence)
+
+
+def test_label_is_escaped_in_cql():
+    with StubConfluence(pages=1) as stub:
+        confluence = ConfluenceIntegration(stub.url, "user", "password")
+
+        collect(confluence, label='docs" OR type=blogpost OR label="x\\')
+
+    assert stub.queries == [
+        'type=page AND label="docs\\" OR type=blogpost OR label=\\"x\\\\"'
+    ]
@@ -0,0 +1,160 @@
+import io
+import zipfile
+
+import docx
+
+from ml.indexing import DocxProcessor
+
+NAMESPACES = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:v="urn:schemas-microsoft-com:vml" '
+    'xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006"'
+)
+IMAGE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+
+ENTITIES = (
+    '<!DOCTYPE w:document [<!ENTITY a "lol lol lol lol lol lol lol lol lol lol">'
+    '<!ENTITY b "&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;">'
+    '<!ENTITY c "&b;&b;&b;&b;&b;&b;&b;&b;&b;&b;">]>'
+)
+
+
+def make_docx(*paragraphs: str) -> bytes:
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_package(body: str, media: dict[str, bytes] | None = None) -> bytes:
+    """
+    Minimal .docx written by hand: the body markup goes into word/document.xml,
+    and media rIds are rId1, rId2, ... in order; rIdExternal points outside.
+    """
+    media = media or {}
+    relationships = "".join(
+        f'<Relationship Id="rId{i}" Type="{IMAGE}" Target="media/{name}"/>'
+        for i, name in enumerate(media, start=1)
+    )
+    relationships += (
+        f'<Relationship Id="rIdExternal" Type="{IMAGE}" '
+        'Target="http://example.com/a.png" TargetMode="External"/>'
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(
+            "_rels/.rels",
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+            'officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+            "</Relationships>",
+        )
+        archive.writestr(
+            "word/_rels/document.xml.rels",
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f"{relationships}</Relationships>",
+        )
+        archive.writestr(
+            "word/document.xml",
+            f"<w:document {NAMESPACES}><w:body>{body}</w:body></w:document>",
+        )
+        for name, content in media.items():
+            archive.writestr(f"word/media/{name}", content)
+    return buffer.getvalue()
+
+
+def paragraph(*runs: str) -> str:
+    return "<w:p>" + "".join(f"<w:r>{run}</w:r>" for run in runs) + "</w:p>"
+
+
+def text(value: str) -> str:
+    return f"<w:t>{value}</w:t>"
+
+
+def with_entities(content: bytes) -> bytes:
+    source = zipfile.ZipFile(io.BytesIO(content))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            if item.filename == "word/document.xml":
+                declaration, body = data.decode().split("?>", 1)
+                body = body.replace("hello world", "hello world &c;")
+                data = f"{declaration}?>{ENTITIES}{body}".encode()
+            archive.writestr(item, data)
+    return buffer.getvalue()
+
+
+def test_paragraph_text_is_extracted():
+    chunks = list(DocxProcessor().process(make_docx("hello world", "second one")))
+
+    assert [chunk.text for chunk in chunks] == ["hello world second one"]
+
+
+def test_entities_in_uploads_are_not_expanded():
+    content = with_entities(make_docx("hello world"))
+
+    chunks = list(DocxProcessor().process(content))
+
+    assert [chunk.text for chunk in chunks] == ["hello world"]
+
+
+def test_table_cells_follow_document_order():
+    cells = "".join(
+        "<w:tr>"
+        + "".join(f"<w:tc>{paragraph(text(cell))}</w:tc>" for cell in row)
+        + "</w:tr>"
+        for row in (("a1", "b1"), ("a2", "b2"))
+    )
+    content = make_package(
+        paragraph(text("before")) + f"<w:tbl>{cells}</w:tbl>" + paragraph(text("after"))
+    )
+
+    chunks = list(DocxProcessor().process(content))
+
+    assert [chunk.text for chunk in chunks] == ["before a1 b1 a2 b2 after"]
+
+
+def test_images_are_resolved_through_relationships():
+    content = make_package(
+        paragraph(text("intro"))
+        + paragraph('<w:drawing><a:blip r:embed="rId1"/></w:drawing>')
+        + paragraph('<w:pict><v:shape><v:imagedata r:id="rId2"/></v:shape></w:pict>')
+        # unknown and external rIds are skipped
+        + paragraph('<w:drawing><a:blip r:embed="rId9"/></w:drawing>')
+        + paragraph('<w:drawing><a:blip r:embed="rIdExternal"/></w:drawing>')
+        + paragraph(text("outro")),
+        media={"one.png": b"first image", "two.png": b"second image"},
+    )
+
+    chunks = list(DocxProcessor().process(content))
+
+    assert [chunk.text for chunk in chunks] == ["intro outro"]
+    assert chunks[0].images == [b"first image", b"second image"]
+
+
+def test_fallback_content_is_read_once():
+    # a text box: the same text and picture in DrawingML and again in legacy VML
+    box = (
+        "<mc:AlternateContent>"
+        '<mc:Choice Requires="wps"><w:drawing><a:blip r:embed="rId1"/>'
+        f"<w:txbxContent>{paragraph(text('boxed'))}</w:txbxContent></w:drawing>"
+        "</mc:Choice>"
+        '<mc:Fallback><w:pict><v:shape><v:imagedata r:id="rId1"/><v:textbox>'
+        f"<w:txbxContent>{paragraph(text('boxed'))}</w:txbxContent>"
+        "</v:textbox></v:shape></w:pict></mc:Fallback>"
+        "</mc:AlternateContent>"
+    )
+    content = make_package(
+        paragraph(text("before")) + paragraph(box) + paragraph(text("after")),
+        media={"box.png": b"box image"},
+    )
+
+    chunks = list(DocxProcessor().process(content))
+
+    assert [chunk.text for chunk in chunks] == ["before boxed after"]
+    assert chunks[0].images == [b"box image"]
@@ -0,0 +1,74 @@
+import io
+
+import torch
+from PIL import Image
+
+from ml.embedding import EmbeddingEngine, dump_embeddings, load_embeddings
+
+
+class Batch(dict):
+    def to(self, device, non_blocking=False):
+        return self
+
+
+class FakeProcessor:
+    def __init__(self):
+        self.calls = []
+
+    def process_images(self, images):
+        widths = [image.width for image in images]
+        self.calls.append(widths)
+        return Batch(
+            widths=torch.tensor(widths),
+            attention_mask=torch.ones(len(images), 2),
+        )
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, widths, attention_mask):
+        # every vector of an image carries its width, so the order can be checked
+        self.calls += 1
+        return torch.ones(len(widths), 2, 4) * widths.reshape(-1, 1, 1)
+
+
+def png(width: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, 4), (10, 20, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def make_engine():
+    return EmbeddingEngine(FakeModel(), FakeProcessor(), "cpu", max_batch_size=8)
+
+
+def test_undecodable_image_is_dropped_from_batch():
+    engine = make_engine()
+    truncated = png(5)[:40]
+
+    embeddings = engine.embed_images(
+        [png(2), b"\x01\x00\x00\x00EMF", png(3), truncated]
+    )
+
+    assert engine.processor.calls == [[2, 3]]
+    assert embeddings[1] is None and embeddings[3] is None
+    assert float(embeddings[0][0][0]) == 2
+    assert float(embeddings[2][0][0]) == 3
+
+
+def test_batch_of_undecodable_images_skips_forward():
+    engine = make_engine()
+
+    assert engine.embed_images([b"not an image", b"neither"]) == [None, None]
+    assert engine.model.calls == 0
+
+
+def test_missing_embeddings_survive_serialization():
+    embeddings = [torch.ones(2, 4), None, torch.ones(3, 4)]
+
+    loaded = load_embeddings(dump_embeddings(embeddings))
+
+    assert loaded[1] is None
+    assert [tuple(e.shape) for e in (loaded[0], loaded[2])] == [(2, 4), (3, 4)]
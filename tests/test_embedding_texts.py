@@ -0,0 +1,49 @@
+import torch
+
+from ml.embedding import EmbeddingEngine
+
+
+class Batch(dict):
+    def to(self, device, non_blocking=False):
+        return self
+
+
+class FakeProcessor:
+    def __init__(self):
+        self.batches = []
+
+    def process_queries(self, texts):
+        self.batches.append(list(texts))
+        return Batch(
+            lengths=torch.tensor([len(text) for text in texts]),
+            attention_mask=torch.ones(len(texts), 2),
+        )
+
+
+def fake_model(lengths, attention_mask):
+    # every vector of a text carries its length, so the order can be checked
+    return torch.ones(len(lengths), 2, 4) * lengths.reshape(-1, 1, 1)
+
+
+def test_texts_are_grouped_by_token_length():
+    processor = FakeProcessor()
+    engine = EmbeddingEngine(fake_model, processor, "cpu", max_batch_size=2)
+    # short in characters but long in tokens, and the other way round
+    texts = ["кот", "aaaaaaaaaaaa", "пёс", "bbbbbbbbbbbb"]
+
+    embeddings = engine.embed_texts(texts, [9, 2, 8, 3])
+
+    assert processor.batches == [
+        ["aaaaaaaaaaaa", "bbbbbbbbbbbb"],
+        ["пёс", "кот"],
+    ]
+    assert [float(embedding[0][0]) for embedding in embeddings] == [3, 12, 3, 12]
+
+
+def test_characters_are_the_fallback_without_token_counts():
+    processor = FakeProcessor()
+    engine = EmbeddingEngine(fake_model, processor, "cpu", max_batch_size=2)
+
+    engine.embed_texts(["cccc", "a", "ddd", "bb"], [4, None, 3, 2])
+
+    assert processor.batches == [["a", "bb"], ["ddd", "cccc"]]
@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from ml.embedding import MicroBatcher
+
+
+class BlockingDouble:
+    """Doubles items; the first batch waits until the test releases it."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.seen = []
+
+    def __call__(self, items):
+        self.seen.extend(items)
+        self.started.set()
+        self.release.wait(5)
+        return [item * 2 for item in items]
+
+
+def test_caller_cancelling_a_running_batch_does_not_kill_the_thread():
+    fn = BlockingDouble()
+    batcher = MicroBatcher(fn, max_batch_size=4, max_wait_ms=1)
+
+    future = batcher.submit(1)
+    assert fn.started.wait(5)
+    # asyncio.wrap_future cancels the future when the awaiting request goes away
+    future.cancel()
+    fn.release.set()
+
+    assert batcher.submit(3).result(timeout=5) == 6
+
+
+def test_cancelled_items_are_dropped_before_the_batch():
+    fn = BlockingDouble()
+    batcher = MicroBatcher(fn, max_batch_size=4, max_wait_ms=1)
+
+    first = batcher.submit(1)
+    assert fn.started.wait(5)
+    cancelled = batcher.submit(2)
+    assert cancelled.cancel()
+    fn.release.set()
+
+    assert first.result(timeout=5) == 2
+    assert batcher.submit(3).result(timeout=5) == 6
+    assert fn.seen == [1, 3]
+
+
+def test_missing_results_fail_the_leftover_futures():
+    batcher = MicroBatcher(lambda items: [], max_batch_size=4, max_wait_ms=1)
+
+    with pytest.raises(RuntimeError):
+        batcher.submit(1).result(timeout=5)
+    # the thread survives and keeps serving
+    with pytest.raises(RuntimeError):
+        batcher.submit(2).result(timeout=5)
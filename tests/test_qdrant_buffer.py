@@ -0,0 +1,135 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from repositories.qdrant import QdrantUpsertBuffer
+from schemas.processor import CreateDocumentOpts
+
+
+class FakeClient:
+    def __init__(self, delay: float = 0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def upsert(self, collection_name, points, wait):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("upsert failed")
+            self.batches.append([point.id for point in points])
+        finally:
+            self.in_flight -= 1
+
+
+def opts(*ids: int):
+    return [
+        CreateDocumentOpts(
+            id=f"00000000-0000-0000-0000-{i:012d}",
+            vector=[[0.0]],
+            pooled_vector=[0.0],
+            metadata={},
+        )
+        for i in ids
+    ]
+
+
+def test_add_sends_full_batches_and_keeps_the_rest():
+    async def run():
+        client = FakeClient()
+        buffer = QdrantUpsertBuffer(client, "test", batch_size=2)
+        await buffer.add(opts(1, 2, 3))
+        assert [len(batch) for batch in client.batches] == [2]
+        await buffer.flush()
+        return client, buffer
+
+    client, buffer = asyncio.run(run())
+    assert [len(batch) for batch in client.batches] == [2, 1]
+    assert buffer.total == 3
+
+
+def test_flush_waits_for_every_worker():
+    async def run():
+        client = FakeClient(delay=0.01)
+        async with QdrantUpsertBuffer(
+            client, "test", batch_size=1, workers=3
+        ) as buffer:
+            await buffer.add(opts(*range(10)))
+            # backpressure keeps at most one batch in flight per worker
+            assert client.max_in_flight <= 3
+        return client
+
+    client = asyncio.run(run())
+    assert client.in_flight == 0
+    assert sorted(id for batch in client.batches for id in batch) == [
+        point.id for point in opts(*range(10))
+    ]
+
+
+def test_flush_raises_upsert_errors():
+    async def run():
+        buffer = QdrantUpsertBuffer(FakeClient(fail=True), "test", workers=2)
+        await buffer.add(opts(1))
+        await buffer.flush()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+
+
+def test_failed_job_drops_buffered_points():
+    async def run():
+        client = FakeClient(delay=0.01)
+        with pytest.raises(ValueError):
+            async with QdrantUpsertBuffer(
+                client, "test", batch_size=2, workers=2
+            ) as buffer:
+                await buffer.add(opts(1, 2, 3))
+                raise ValueError("parsing failed")
+        return client
+
+    client = asyncio.run(run())
+    # the batch already sent is awaited, the buffered point is not sent
+    assert [len(batch) for batch in client.batches] == [2]
+    assert client.in_flight == 0
+
+
+def test_large_multivectors_are_split_under_byte_limit():
+    rng = np.random.default_rng(0)
+    # 1000-patch image points, about 2.6 MB each as REST JSON
+    images = [
+        CreateDocumentOpts(
+            id=f"00000000-0000-0000-0000-{i:012d}",
+            vector=rng.standard_normal((1000, 128), dtype=np.float32).tolist(),
+            pooled_vector=rng.standard_normal(128, dtype=np.float32).tolist(),
+            metadata={"text": "изображение"},
+        )
+        for i in range(7)
+    ]
+    max_bytes = 8 * 1024 * 1024
+
+    class SizingClient(FakeClient):
+        def __init__(self):
+            super().__init__()
+            self.sizes = []
+
+        async def upsert(self, collection_name, points, wait):
+            self.sizes.append(sum(len(point.model_dump_json()) for point in points))
+            await super().upsert(collection_name, points, wait)
+
+    async def run():
+        client = SizingClient()
+        async with QdrantUpsertBuffer(
+            client, "test", batch_size=256, max_bytes=max_bytes
+        ) as buffer:
+            await buffer.add(images)
+        return client
+
+    client = asyncio.run(run())
+    assert sum(len(batch) for batch in client.batches) == 7
+    assert len(client.batches) > 1
+    assert all(size <= max_bytes for size in client.sizes)
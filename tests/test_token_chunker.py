@@ -0,0 +1,121 @@
+from typing import List
+
+import pytest
+
+from ml.chunking import Chunk, TokenChunker, TokenCounter
+
+
+def one_token(words: List[str]) -> List[int]:
+    return [1] * len(words)
+
+
+def collect(chunker: TokenChunker, blocks: List[str]) -> List[Chunk]:
+    chunks = []
+    for block in blocks:
+        chunker.tokens.add_words(block)
+        chunks.extend(chunker.ready())
+    chunks.extend(chunker.finish())
+    return chunks
+
+
+def test_whole_sentences_are_packed_into_the_budget():
+    chunks = collect(TokenChunker(one_token, 6, 2), ["a b c. d e. f g h i."])
+
+    assert [chunk.text for chunk in chunks] == ["a b c. d e.", "d e. f g h i."]
+    assert [chunk.token_count for chunk in chunks] == [5, 6]
+    assert chunks[0].metadata()["token_count"] == 5
+
+
+def test_closing_quotes_and_block_ends_finish_sentences():
+    quoted = collect(TokenChunker(one_token, 4, 0), ['he said "yes." then more'])
+    assert [chunk.text for chunk in quoted] == ['he said "yes."', "then more"]
+
+    # each ready() call ends a paragraph, page or slide
+    blocks = collect(TokenChunker(one_token, 4, 0), ["one two", "three four five"])
+    assert [chunk.text for chunk in blocks] == ["one two", "three four five"]
+
+
+def test_oversized_sentence_is_split_by_words():
+    chunks = collect(
+        TokenChunker(one_token, 4, 1), [" ".join(f"x{i}" for i in range(10))]
+    )
+
+    assert [chunk.text for chunk in chunks] == [
+        "x0 x1 x2 x3",
+        "x4 x5 x6 x7",
+        "x8 x9",
+    ]
+    assert all(chunk.token_count <= 4 for chunk in chunks)
+
+
+def test_block_ending_with_an_over_budget_word_is_cut():
+    # a long URL, base64 or text extracted without spaces is one huge "word"
+    chunker = TokenChunker(lambda words: [len(word) for word in words], 9, 0)
+    blob = "h" * 40
+
+    chunks = collect(chunker, ["ok then " + blob, "next block"])
+
+    assert [chunk.text for chunk in chunks] == ["ok then", blob, "next block"]
+    assert chunks[2].start_word == 3
+
+
+def test_overlap_repeats_the_tail_sentences_within_budget():
+    text = "a b. c d. e f. g h."
+
+    overlapping = collect(TokenChunker(one_token, 5, 3), [text])
+    assert [chunk.text for chunk in overlapping] == [
+        "a b. c d.",
+        "c d. e f.",
+        "e f. g h.",
+    ]
+
+    # a tail sentence longer than the overlap is not repeated
+    disjoint = collect(TokenChunker(one_token, 5, 1), [text])
+    assert [chunk.text for chunk in disjoint] == ["a b. c d.", "e f. g h."]
+
+
+def test_every_image_goes_to_exactly_one_chunk():
+    chunker = TokenChunker(one_token, 6, 2)
+    chunker.tokens.add_image(b"leading")
+    chunker.tokens.add_words("a b c.")
+    chunker.tokens.add_image(b"overlapped")
+    chunker.tokens.add_words("d e.")
+    chunker.tokens.add_image(b"inner")
+    chunker.tokens.add_words("f g h i.")
+    chunker.tokens.add_image(b"trailing")
+
+    chunks = list(chunker.finish())
+
+    assert [chunk.images for chunk in chunks] == [
+        [b"leading"],
+        [b"overlapped", b"inner", b"trailing"],
+    ]
+
+
+def test_counts_come_from_the_tokenizer():
+    chunks = collect(
+        TokenChunker(lambda words: [len(word) for word in words], 9, 0),
+        ["aaaa bbbb. cc dd."],
+    )
+
+    assert [chunk.text for chunk in chunks] == ["aaaa bbbb.", "cc dd."]
+    assert [chunk.token_count for chunk in chunks] == [9, 5]
+
+
+def test_overlap_must_be_smaller_than_the_budget():
+    with pytest.raises(ValueError):
+        TokenChunker(one_token, 4, 4)
+
+
+def test_token_counter_caches_word_lengths():
+    calls = []
+
+    def tokenizer(texts, add_special_tokens):
+        calls.append(texts)
+        return {"input_ids": [list(text) for text in texts]}
+
+    count = TokenCounter(lambda: tokenizer, cache_size=2)
+
+    assert count(["ab", "c", "ab"]) == [3, 2, 3]
+    assert count(["c"]) == [2]
+    assert calls == [[" ab", " c"]]
@@ -0,0 +1,64 @@
+import asyncio
+import hashlib
+import json
+import uuid
+from concurrent.futures import Executor
+from itertools import islice
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+# namespace for ids derived from content, so that the same input always maps to the same id
+CONTENT_NAMESPACE = uuid.UUID("6f1c1e2a-93a4-4c55-9a0e-2b8f4f3d7c10")
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def content_hash(*parts: bytes | str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        # length prefix keeps ("ab", "c") and ("a", "bc") apart
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def stable_id(*parts: str) -> str:
+    return str(uuid.uuid5(CONTENT_NAMESPACE, "\0".join(parts)))
+
+
+async def run_in(executor: Executor, fn: Callable[..., T], *args) -> T:
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+async def iterate_in(executor: Executor, iterator: Iterator[T]) -> AsyncIterator[T]:
+    done = object()
+    iterator = iter(iterator)
+    step = None
+    try:
+        while True:
+            step = executor.submit(next, iterator, done)
+            item = await asyncio.wrap_future(step)
+            if item is done:
+                return
+            yield item
+    finally:
+        # a cancelled consumer does not stop a step already running in the executor,
+        # and a generator cannot be closed while it is executing
+        if step is not None and not step.done():
+            await asyncio.wait([asyncio.wrap_future(step)])
+        close = getattr(iterator, "close", None)
+        if close:
+            await run_in(executor, close)
+
+
+async def sse(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    async for token in tokens:
+        yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+    yield "event: done\ndata: {}\n\n"